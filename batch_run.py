@@ -0,0 +1,157 @@
+# Headless batch mode: runs the researcher, business angel and autor crew over
+# a file of topics without the web-app.
+#
+# Every line of the input file is a JSON object with a "description" (or
+# "topic") and an optional "id", for example:
+#   {"id": "ai-finance", "description": "Generative AI startups in the finance sector"}
+#
+# Usage:
+#   python batch_run.py topics.jsonl --output reports --concurrency 2
+#
+# One markdown report and one JSON trace per topic are written to the output
+# folder together with summary.json and summary.md which list the timings of
+# every topic.
+
+import argparse
+import json
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from crew_builder import DEFAULT_AGENTS, ROLES, crew_config, default_example_tasks, route_agents, run_crew
+from tools.instrumentation import RunTrace
+from tools.ollama_llm import CachedOllama
+from tools.ollama_pool import get_ollama_pool
+from tools.settings import get_flag, get_setting
+from tools.task_rewrite import rewrite_tasks, rewrite_tasks_batch
+
+
+def load_topics(path):
+  topics = []
+  with open(path, encoding="utf-8") as f:
+    for number, line in enumerate(f, start=1):
+      line = line.strip()
+      if not line:
+        continue
+      entry = json.loads(line)
+      description = entry.get("description") or entry.get("topic")
+      if not description:
+        raise ValueError(f"{path}:{number}: the topic has no description")
+      topic_id = str(entry.get("id") or slugify(description)[:60] or f"topic-{number}")
+      if any(topic["id"] == topic_id for topic in topics):
+        topic_id = f"{topic_id}-{number}"
+      topics.append({"id": topic_id, "description": description})
+  return topics
+
+
+def slugify(text):
+  return re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+
+
+def run_topic(topic, args, examples):
+  """Rewrite the example tasks for the topic, run the crew and write the
+  report. Returns the timings of the topic."""
+  record = {"id": topic["id"], "description": topic["description"], "status": "done"}
+  started = time.time()
+  try:
+    pool = get_ollama_pool(args.base_url)
+    agents = {role: dict(DEFAULT_AGENTS[role]) for role in ROLES}
+    for role in ROLES:
+      model = getattr(args, f"{role}_model")
+      if model:
+        agents[role]["model"] = model
+    config = crew_config(args.base_url, agents, {}, parallel=args.parallel, compact_tokens=args.compact_tokens,
+                         checkpoints=args.checkpoints, description=topic["description"])
+    # The models of the agents are loaded while the tasks are rewritten.
+    warm_up = route_agents(config, pool)
+    for host, model in warm_up:
+      pool.warm_up(host, model)
+
+    rewrite_llm = CachedOllama(model=args.rewrite_model, base_url=pool.pick(args.rewrite_model), temperature=args.rewrite_temperature)
+    rewrite = rewrite_tasks_batch if args.rewrite_batch else rewrite_tasks
+    config["tasks"] = dict(rewrite(rewrite_llm, examples, topic["description"]))
+    record["rewrite_seconds"] = round(time.time() - started, 2)
+
+    pool.warm_up_all(warm_up)
+    crew_started = time.time()
+    trace = RunTrace(topic["id"])
+    result = run_crew(config, trace=trace)
+    record["crew_seconds"] = round(time.time() - crew_started, 2)
+
+    name = slugify(topic['id']) or 'topic'
+    report = os.path.join(args.output, f"{name}.md")
+    with open(report, "w", encoding="utf-8") as f:
+      f.write(str(result))
+    record["report"] = report
+    # The timings of every agent step, LLM call and tool call.
+    with open(os.path.join(args.output, f"{name}.trace.json"), "w", encoding="utf-8") as f:
+      f.write(trace.to_json())
+  except Exception as e:
+    record["status"] = "failed"
+    record["error"] = f"{e}\n{traceback.format_exc()}"
+  record["total_seconds"] = round(time.time() - started, 2)
+  return record
+
+
+def write_summary(output, records, wall_seconds):
+  with open(os.path.join(output, "summary.json"), "w", encoding="utf-8") as f:
+    json.dump({"wall_seconds": round(wall_seconds, 2), "topics": records}, f, indent=2)
+
+  lines = [
+      "# Batch run summary",
+      "",
+      f"{sum(r['status'] == 'done' for r in records)} of {len(records)} topics done in {wall_seconds:.0f}s.",
+      "",
+      "| Topic | Status | Rewrite [s] | Crew [s] | Total [s] |",
+      "| --- | --- | --- | --- | --- |",
+  ]
+  for r in records:
+    lines.append(f"| {r['id']} | {r['status']} | {r.get('rewrite_seconds', '-')} | {r.get('crew_seconds', '-')} | {r['total_seconds']} |")
+  with open(os.path.join(output, "summary.md"), "w", encoding="utf-8") as f:
+    f.write("\n".join(lines) + "\n")
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Run the crew of the web-app over a JSONL file of topics.")
+  parser.add_argument("topics", help="JSONL file, one topic per line")
+  parser.add_argument("--output", default="reports", help="folder for the reports and the summary")
+  parser.add_argument("--concurrency", type=int, default=int(get_setting("BATCH_CONCURRENCY", 2)),
+                      help="topics which are processed at the same time")
+  parser.add_argument("--base-url", default=get_setting("OLLAMA_BASE_URL", "http://localhost:11434"),
+                      help="URL of the Ollama server")
+  parser.add_argument("--parallel", action="store_true", default=get_flag("PARALLEL_TASKS"),
+                      help="run the business angel and the autor task at the same time")
+  parser.add_argument("--compact-tokens", type=int, default=int(get_setting("CONTEXT_BUDGET_TOKENS", 0)),
+                      help="shorten the results handed to the next task to about this many tokens, 0 = off")
+  parser.add_argument("--checkpoints", action=argparse.BooleanOptionalAction, default=get_flag("CHECKPOINTS", True),
+                      help="save every finished task, a topic which is run again only runs the tasks which changed")
+  parser.add_argument("--rewrite-model", default="openhermes:latest")
+  parser.add_argument("--rewrite-temperature", type=float, default=0.0)
+  parser.add_argument("--rewrite-batch", action=argparse.BooleanOptionalAction, default=get_flag("REWRITE_BATCH"),
+                      help="rewrite all three tasks with one request")
+  for role in ROLES:
+    parser.add_argument(f"--{role}-model", default=None, help=f"default: {DEFAULT_AGENTS[role]['model']}")
+  args = parser.parse_args(argv)
+
+  topics = load_topics(args.topics)
+  os.makedirs(args.output, exist_ok=True)
+  examples = default_example_tasks()
+
+  started = time.time()
+  records = {}
+  with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+    futures = {executor.submit(run_topic, topic, args, examples): topic for topic in topics}
+    for future in as_completed(futures):
+      record = future.result()
+      records[record["id"]] = record
+      print(f"[{len(records)}/{len(topics)}] {record['id']}: {record['status']} in {record['total_seconds']}s")
+  # The summary keeps the order of the input file.
+  ordered = [records[topic["id"]] for topic in topics]
+  write_summary(args.output, ordered, time.time() - started)
+  return 0 if all(r["status"] == "done" for r in ordered) else 1
+
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,77 @@
+# Import time profile of the app.
+#
+# Usage (from the root of the repository):
+#   python -m benchmarks.import_profile
+#   python -m benchmarks.import_profile crew_builder tools.search_tools --top 30
+#
+# Every module is imported in a fresh interpreter with `python -X importtime`.
+# The report lists the packages which take the most time, cumulative (with
+# everything they import) and on their own.
+
+import argparse
+import json
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["crewAI_next_generation_github_version"]
+
+
+def profile(module):
+  """Import the module in a new interpreter and return one dict per imported
+  module with its own and its cumulative import time in seconds."""
+  completed = subprocess.run(
+      [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+      capture_output=True, text=True)
+  rows = []
+  for line in completed.stderr.splitlines():
+    if not line.startswith("import time:") or "|" not in line:
+      continue
+    self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+    if not self_us.strip().isdigit():
+      # The header line.
+      continue
+    rows.append({
+        "module": name.strip(),
+        "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+        "self": int(self_us) / 1e6,
+        "cumulative": int(cumulative_us) / 1e6,
+    })
+  if completed.returncode != 0:
+    print(f"Importing {module} failed:\n{completed.stderr.splitlines()[-1] if completed.stderr else ''}", file=sys.stderr)
+  return rows
+
+
+def report(module, rows, top):
+  total = max((row["cumulative"] for row in rows if row["depth"] == 0 and row["module"] == module), default=0.0)
+  print(f"\n{module}: {total:.3f}s, {len(rows)} modules imported")
+  # Top level packages show what dominates the start up.
+  packages = {}
+  for row in rows:
+    package = row["module"].split(".")[0]
+    packages[package] = packages.get(package, 0.0) + row["self"]
+  print(f"\n  {'package':40s} {'seconds':>8s}")
+  for package, seconds in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+    print(f"  {package:40s} {seconds:8.3f}")
+  print(f"\n  {'module':50s} {'self':>8s} {'cumul.':>8s}")
+  for row in sorted(rows, key=lambda row: -row["cumulative"])[:top]:
+    print(f"  {row['module'][:50]:50s} {row['self']:8.3f} {row['cumulative']:8.3f}")
+  return {"module": module, "seconds": total, "packages": packages, "modules": rows}
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Import time profile of the app with python -X importtime.")
+  parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES, help="modules to import, by default the app")
+  parser.add_argument("--top", type=int, default=20, help="number of packages and modules listed")
+  parser.add_argument("--output", help="file for the machine readable results")
+  args = parser.parse_args(argv)
+
+  results = [report(module, profile(module), args.top) for module in args.modules]
+  if args.output:
+    with open(args.output, "w", encoding="utf-8") as f:
+      json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+  return 0
+
+
+if __name__ == "__main__":
+  raise SystemExit(main())
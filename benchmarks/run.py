@@ -0,0 +1,175 @@
+# Offline benchmark of the app against local stand-ins for Ollama, Serper
+# and browserless.
+#
+# Usage (from the root of the repository):
+#   python -m benchmarks.run --iterations 10 --output bench.json
+#   python -m benchmarks.run --baseline bench.json
+#
+# Every stage is run a few times and its p50/p95 latency is reported. The
+# results are written as JSON, with --baseline the p50 values are compared
+# with an older result and the run fails if a stage got slower than allowed.
+
+import argparse
+import datetime
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.stub_servers import StubConfig, StubServer
+
+
+def percentile(values, fraction):
+  """Nearest rank percentile of the values."""
+  ordered = sorted(values)
+  index = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+  return ordered[index]
+
+
+def measure(function, iterations):
+  latencies = []
+  for i in range(iterations):
+    started = time.perf_counter()
+    function(i)
+    latencies.append(time.perf_counter() - started)
+  return {
+      "iterations": iterations,
+      "p50": round(percentile(latencies, 0.50), 4),
+      "p95": round(percentile(latencies, 0.95), 4),
+      "mean": round(sum(latencies) / len(latencies), 4),
+      "min": round(min(latencies), 4),
+      "max": round(max(latencies), 4),
+  }
+
+
+def configure(url, cache_dir):
+  """Point all tools to the stub server. This has to happen before the tools
+  are imported, they read their settings from the environment."""
+  os.environ.update({
+      "SERPER_URL": f"{url}/search",
+      "SERPER_API_KEY": "benchmark",
+      "BROWSERLESS_URL": url,
+      "BROWSERLESS_API_KEY": "benchmark",
+      "OLLAMA_BASE_URL": url,
+      "SUMMARY_MODEL": "openhermes:latest",
+      "SUMMARY_BASE_URL": url,
+      "OPENAI_API_KEY": "benchmark",
+      # Every run starts with empty caches on disk and without the LLM
+      # cache, otherwise the LLM stages would only measure cache hits.
+      "SEARCH_CACHE_PATH": os.path.join(cache_dir, "search_cache.sqlite"),
+      "LLM_CACHE_PATH": os.path.join(cache_dir, "llm_cache.sqlite"),
+      "PAGE_CACHE_PATH": os.path.join(cache_dir, "page_cache.sqlite"),
+      "RUN_STORE_PATH": os.path.join(cache_dir, "runs.sqlite"),
+      # The pages of the benchmark do not exist, they are not asked for an ETag.
+      "PAGE_REVALIDATE": "false",
+      "LLM_CACHE": "false",
+  })
+
+
+def stages(url):
+  from crew_builder import DEFAULT_AGENTS, ROLES, crew_config, default_example_tasks, run_crew
+  from tools.browser_tools import BrowserTools
+  from tools.ollama_llm import CachedOllama
+  from tools.search_tools import SearchTools
+  from tools.task_rewrite import rewrite_tasks
+
+  examples = default_example_tasks()
+
+  def search(i):
+    # A new query every time, a cache hit would not measure anything.
+    SearchTools.search_internet.run(f"generative ai startups finance {i}")
+
+  def scrape(i):
+    BrowserTools.scrape_and_summarize_website.run(
+        {"website": f"https://example.com/article-{i}", "query": "funding of generative AI startups"})
+
+  def rewrite(i):
+    llm = CachedOllama(model="openhermes:latest", base_url=url, temperature=0.0)
+    dict(rewrite_tasks(llm, examples, f"AI startups in the insurance sector {i}"))
+
+  def crew(i):
+    agents = {role: dict(DEFAULT_AGENTS[role]) for role in ROLES}
+    run_crew(crew_config(url, agents, {role: f"{examples[role]}\n{i}" for role in ROLES}))
+
+  def crew_parallel(i):
+    agents = {role: dict(DEFAULT_AGENTS[role]) for role in ROLES}
+    run_crew(crew_config(url, agents, {role: f"{examples[role]}\n{i}" for role in ROLES}, parallel=True))
+
+  return {"search": search, "scrape": scrape, "rewrite": rewrite, "crew": crew, "crew_parallel": crew_parallel}
+
+
+def git_version():
+  try:
+    return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return "unknown"
+
+
+def compare(results, baseline, tolerance):
+  """Print the p50 of every stage next to the baseline. Returns False if a
+  stage is slower than the baseline by more than the tolerance."""
+  ok = True
+  for name, stage in results["stages"].items():
+    old = baseline.get("stages", {}).get(name)
+    if not old:
+      continue
+    ratio = stage["p50"] / old["p50"] if old["p50"] else 1.0
+    regression = ratio > 1.0 + tolerance
+    ok = ok and not regression
+    print(f"{name:10s} p50 {old['p50']:.3f}s -> {stage['p50']:.3f}s ({ratio:.2f}x){'  REGRESSION' if regression else ''}")
+  return ok
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Offline benchmark with local stand-ins for Ollama, Serper and browserless.")
+  parser.add_argument("--iterations", type=int, default=5)
+  parser.add_argument("--stages", default="search,scrape,rewrite,crew,crew_parallel", help="comma separated list of stages")
+  parser.add_argument("--output", default="bench_output.json", help="file for the machine readable results")
+  parser.add_argument("--baseline", help="results of an older run to compare with")
+  parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slow down against the baseline, 0.2 = 20%%")
+  parser.add_argument("--ollama-latency", type=float, default=0.2, help="seconds until the first token")
+  parser.add_argument("--tokens-per-second", type=float, default=50.0)
+  parser.add_argument("--answer-tokens", type=int, default=60)
+  parser.add_argument("--serper-latency", type=float, default=0.3)
+  parser.add_argument("--browserless-latency", type=float, default=0.5)
+  parser.add_argument("--page-kb", type=int, default=100, help="size of the canned html page")
+  args = parser.parse_args(argv)
+
+  config = StubConfig(
+      ollama_latency=args.ollama_latency, tokens_per_second=args.tokens_per_second,
+      answer_tokens=args.answer_tokens, serper_latency=args.serper_latency,
+      browserless_latency=args.browserless_latency, page_kb=args.page_kb)
+
+  with StubServer(config) as server, tempfile.TemporaryDirectory() as cache_dir:
+    configure(server.url, cache_dir)
+    available = stages(server.url)
+    results = {
+        "version": git_version(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "config": vars(config),
+        "stages": {},
+    }
+    for name in args.stages.split(","):
+      name = name.strip()
+      results["stages"][name] = measure(available[name], args.iterations)
+      stage = results["stages"][name]
+      print(f"{name:10s} p50 {stage['p50']:.3f}s  p95 {stage['p95']:.3f}s  ({args.iterations} runs)")
+
+  with open(args.output, "w", encoding="utf-8") as f:
+    json.dump(results, f, indent=2)
+  print(f"Results written to {args.output}")
+
+  if args.baseline:
+    with open(args.baseline, encoding="utf-8") as f:
+      baseline = json.load(f)
+    if not compare(results, baseline, args.tolerance):
+      return 1
+  return 0
+
+
+if __name__ == "__main__":
+  raise SystemExit(main())
@@ -0,0 +1,158 @@
+# Local stand-ins for Ollama, Serper and browserless. They answer like the
+# real services with a configurable latency, so the app can be measured
+# without any network access or api quota.
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FINAL_ANSWER = "Thought: I now know the final answer\nFinal Answer: "
+
+PAGE_BLOCKS = [
+    "<p>Generative AI startups in the finance sector raised new funding this year. "
+    "Kern AI and Scrub AI work on document automation for banks and insurers.</p>",
+    "<p>Analysts expect the market for AI based fraud detection to grow quickly, "
+    "several startups are still searching for investments.</p>",
+    "<h2>Funding rounds</h2><ul><li>Startup A: 10 million seed round</li><li>Startup B: 25 million series A</li></ul>",
+]
+
+
+def canned_html(size_kb):
+  """A page with navigation, scripts and a footer around size_kb kilobytes of
+  content, like a typical news site."""
+  blocks = []
+  size = 0
+  while size < size_kb * 1024:
+    block = PAGE_BLOCKS[len(blocks) % len(PAGE_BLOCKS)]
+    blocks.append(block)
+    size += len(block)
+  return ("<html><head><title>AI in finance</title><script>var tracking = 1;</script></head><body>"
+          "<nav><a href='/'>Home</a><a href='/news'>News</a></nav><main>"
+          + "".join(blocks) +
+          "</main><footer>Imprint - Privacy - Cookies</footer></body></html>")
+
+
+class StubConfig():
+
+  def __init__(self, ollama_latency=0.2, tokens_per_second=50.0, answer_tokens=60,
+               serper_latency=0.3, browserless_latency=0.5, page_kb=100):
+    self.ollama_latency = ollama_latency
+    self.tokens_per_second = tokens_per_second
+    self.answer_tokens = answer_tokens
+    self.serper_latency = serper_latency
+    self.browserless_latency = browserless_latency
+    self.page_kb = page_kb
+
+
+def make_handler(config, models):
+  page = canned_html(config.page_kb).encode("utf-8")
+
+  class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+      pass
+
+    def _body(self):
+      length = int(self.headers.get("Content-Length") or 0)
+      raw = self.rfile.read(length) if length else b""
+      try:
+        return json.loads(raw or b"{}")
+      except ValueError:
+        return {}
+
+    def _send(self, status, body, content_type="application/json"):
+      if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(len(body)))
+      self.end_headers()
+      self.wfile.write(body)
+
+    def do_GET(self):
+      if self.path.startswith("/api/tags"):
+        self._send(200, {"models": [{"name": name} for name in models]})
+      elif self.path.startswith("/api/ps"):
+        self._send(200, {"models": [{"name": name, "model": name} for name in models]})
+      else:
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+      body = self._body()
+      if self.path.startswith("/api/generate"):
+        self._generate(body)
+      elif self.path.startswith("/api/embed"):
+        time.sleep(config.ollama_latency)
+        prompt = str(body.get("prompt") or body.get("input") or "")
+        vector = [float((hash(word) % 97) / 97.0) for word in prompt.split()[:8]] + [0.0] * 8
+        self._send(200, {"embedding": vector[:8], "embeddings": [vector[:8]]})
+      elif self.path.startswith("/api/show"):
+        self._send(200, {"model_info": {"llama.context_length": 8192}, "parameters": "num_ctx 4096"})
+      elif self.path.startswith("/search"):
+        time.sleep(config.serper_latency)
+        query = body.get("q", "")
+        self._send(200, {"organic": [
+            {"title": f"Result {i} for {query}", "link": f"https://example.com/{i}", "snippet": f"Snippet {i} about {query}."}
+            for i in range(1, 9)
+        ]})
+      elif self.path.startswith("/content"):
+        time.sleep(config.browserless_latency)
+        self._send(200, page, content_type="text/html; charset=utf-8")
+      else:
+        self._send(404, {"error": "not found"})
+
+    def _generate(self, body):
+      # Answers in the ReAct format crewAI expects, so every agent finishes
+      # after one step.
+      tokens = ["token"] * max(1, config.answer_tokens)
+      prompt_tokens = len(str(body.get("prompt", "")).split())
+      done = {"model": body.get("model"), "done": True,
+              "prompt_eval_count": prompt_tokens, "eval_count": len(tokens) + 1}
+      time.sleep(config.ollama_latency)
+      if body.get("stream") is False:
+        time.sleep(len(tokens) / config.tokens_per_second)
+        self._send(200, dict(done, response=FINAL_ANSWER + " ".join(tokens)))
+        return
+      self.send_response(200)
+      self.send_header("Content-Type", "application/x-ndjson")
+      self.send_header("Transfer-Encoding", "chunked")
+      self.end_headers()
+      self._chunk({"model": body.get("model"), "response": FINAL_ANSWER, "done": False})
+      for token in tokens:
+        time.sleep(1.0 / config.tokens_per_second)
+        self._chunk({"model": body.get("model"), "response": " " + token, "done": False})
+      self._chunk(dict(done, response=""))
+      self.wfile.write(b"0\r\n\r\n")
+
+    def _chunk(self, data):
+      line = json.dumps(data).encode("utf-8") + b"\n"
+      self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+      self.wfile.flush()
+
+  return Handler
+
+
+class StubServer():
+  """One threaded http server which plays Ollama, Serper and browserless on
+  a free local port."""
+
+  def __init__(self, config=None, models=("openhermes:latest", "mistral:latest")):
+    self.config = config or StubConfig()
+    self._server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(self.config, list(models)))
+    self._server.daemon_threads = True
+    self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+  @property
+  def url(self):
+    host, port = self._server.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def __enter__(self):
+    self._thread.start()
+    return self
+
+  def __exit__(self, *exc):
+    self._server.shutdown()
+    self._server.server_close()
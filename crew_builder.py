@@ -0,0 +1,451 @@
+# Builds the researcher, business angel and autor crew from plain settings.
+# The web-app and background jobs use it, so a crew can be created outside of
+# the streamlit script thread.
+
+import datetime
+import uuid
+from contextlib import nullcontext
+from functools import lru_cache
+from textwrap import dedent
+
+# crewAI, LangChain and the tools are imported when the first crew is built,
+# so the app can render its page without loading them.
+
+# The roles of the crew in the order in which their tasks are executed.
+ROLES = ("researcher", "consultant", "autor")
+
+
+# The defaults of the web-app which are also used by the batch mode.
+DEFAULT_AGENTS = {
+    "researcher": {
+        "model": "openhermes:latest",
+        "temperature": 0.0,
+        "max_iterations": "15",
+        "role": 'Senior research analyst',
+        "goal": 'As a Senior Research Analyst, you play a key role in analyzing data to offer strategic insights for decision-making. This requires strong analytical skills, critical thinking, and industry knowledge.',
+        "backstory": 'As a Senior Research Analyst, you hold an advanced degree in fields like economics or statistics. With expertise in research methodologies and data analysis, you execute projects across diverse industries. Your insights aid decision-making, and you stay updated on industry trends through continuous learning.',
+    },
+    "consultant": {
+        "model": "openhermes:latest",
+        "temperature": 0.0,
+        "max_iterations": "15",
+        "role": 'Business Angel and venture capital consultant',
+        "goal": 'As a Business Angels and Venture Capital Consultant you are playing a vital role in the startup ecosystem by providing funding, mentorship, and strategic guidance to early-stage companies. While their roles share similarities, they differ in terms of investment focus, funding sources, and level of involvement.',
+        "backstory": 'Business Angels and Venture Capital Consultants typically possess extensive experience in finance, entrepreneurship, and investment management. They may have backgrounds in fields such as investment banking, private equity, corporate finance, or startup leadership. Many have built successful careers in the financial industry, gaining expertise in deal sourcing, due diligence, portfolio management, and strategic advisory.',
+    },
+    "autor": {
+        "model": "mistral:latest",
+        "temperature": 0.0,
+        "max_iterations": "15",
+        "role": 'Tech content autor',
+        "goal": 'As a Tech Content Author you are playing a crucial role in creating and curating high-quality content focused on technology topics. This role requires a combination of technical expertise, writing proficiency, and the ability to communicate complex concepts in a clear and engaging manner.',
+        "backstory": 'As a Tech Content Author, you hold a degree in journalism, communications, computer science, or related fields. With a passion for technology, you possess a deep understanding of technical concepts and trends. Starting your career in roles like technical writing or content creation, you have honed strong writing skills and the ability to simplify complex ideas. Through continuous learning, you stay updated on emerging technologies, ensuring your content remains relevant in the ever-changing tech landscape.',
+    },
+}
+
+
+def default_example_tasks():
+  """The example tasks for the researcher, the consultant and the autor. They
+  end with the date of today."""
+  return dict(_example_tasks(datetime.date.today()))
+
+
+# The texts are only built again when the date changes.
+@lru_cache(maxsize=1)
+def _example_tasks(today):
+  return {
+    "researcher": dedent(f"""Conduct a comprehensive analysis of the latest high performing startups active in the 
+field of generative AI. It is important that those startups with their advancements in 
+generative AI are active in the finance sector since a year. Identify key startups, 
+breakthrough technologies, and potential fast growing startups with impact in the finance 
+sector caused by generative AI. As a researcher you analyse how generative AI will change 
+the finance industry. It would be good to know if that startup is still searching for money 
+investments actively. Your final answer MUST be a full analysis report.
+Example Report: 
+    Finance Tech Startup Research Table: 
+    - Startup 1: 
+        - Name: "Kern AI" 
+        - Investment sum: 1.00.00.000 
+        - Founded in: 2022 
+        - Number of Employees: 50 
+        - Company homepage: https://www.kern.ai/ 
+    - Startup 2: 
+        - Name: "Scrub AI" 
+        - Investment sum: 5.00.00.000 
+        - Founded in: 2023 
+        - Number of Employees: 22 
+        - Company homepage: https://scrub-ai.com/
+Today is the """)+str(today)+""" .""",
+    "consultant": dedent(f"""Involve evaluating investment opportunities, conducting due diligence 
+on potential ventures, and advising startups on strategy, fundraising, and growth tactics. Search how much venture capital each startup already raised. 
+Add a comment if an future investment would be an option for an investor. Only from interest are startups in finance sector which are active over the last 
+year and this year. Additionally, they often facilitate connections between entrepreneurs and potential investors, leveraging their network to bridge the 
+gap between promising startups and capital sources. 
+Executive Summary:
+- Concise overview of the investment opportunity.
+- Highlights of key figures and decision points.
+- Summary of investment recommendations.
+Introduction:
+- Introduction to the company or opportunity being presented.
+- Purpose of the report.
+- Scope and methodology.
+Market Analysis:
+    - Market overview:
+        - Size, growth rate, and trends.
+        - Market segmentation.
+    - Competitive landscape:
+        - Major players and market share.
+        - Competitive advantages of the company.
+Business Model:
+- Description of the company's business model.
+- Revenue streams and sources.
+- Cost structure and scalability.
+Financial Performance:
+    - Revenue analysis:
+        - Historical revenue trends.
+        - Forecasted revenue growth.
+    - Profitability analysis:
+        - Gross margin, operating margin, net margin.
+    - Cash flow analysis:
+        - Operating cash flow, free cash flow.
+    - Key financial ratios:
+        - Return on Investment (ROI), Return on Equity (ROE), Debt-to-Equity ratio, etc.
+Investment Thesis:
+
+Investment opportunity:
+    - Value proposition.
+    - Unique selling points.
+    - Potential returns:
+        - Expected ROI.
+        - Risk-adjusted returns.
+    - Risks and Mitigation Strategies:
+
+    - Identification of potential risks:
+        - Market risks, operational risks, regulatory risks, etc.
+    - Mitigation strategies:
+        - Plans to address identified risks.
+    - Strategic Growth Initiatives:
+Expansion plans:
+    - Geographic expansion, product diversification, etc.
+Research and development:
+    - Innovation pipeline and investments.
+Strategic partnerships:
+    - Alliances, joint ventures, collaborations.
+Valuation:
+    Valuation methodology:
+        - Discounted Cash Flow (DCF), Comparable Company Analysis (CCA), etc.
+        - Valuation assumptions and inputs.
+Investment Recommendations:
+    - Summary of key findings and analysis.
+Investment decision:
+    - Buy, sell, hold recommendations.
+    - Justification of recommendations.
+Conclusion:
+    - Summary of the investment opportunity.
+    - Closing remarks.
+Appendix:
+    - Detailed financial tables.
+    - Glossary of financial terms.
+    - Assumptions used in the analysis.
+References:
+- Sources of information used in the report.                          
+Today is the """)+str(today)+""" .""",
+    "autor": dedent(f"""Using the insights provided, write an article like an engaging blog post that highlights the most significant startups 
+active in generative AI with important advancements in this field. Your written article should be informative yet accessible, catering to a tech-savvy startup scene and 
+audience. Make it sound cool, avoid complex words so it doesn't sound like AI. Your final answer MUST be the a full structures blog post 
+The article you are writing has a minimum of 1600 words and highlights 10 startups. In the summary please list the startups with web addresses like url's headlines and bullet points for easy reading. 
+The text itself is enriched with nice emojis to highlight important parts.
+                                                       
+The structure of the article you have to write could look like the example below: 
+                                                       
+Example article structure:
+    Executive Summary: 
+    - Overview of the AI startup's performance. 
+    - Key financial metrics and achievements. 
+    - Future growth prospects. 
+    - Introduction: 
+    - Brief background of the AI startup. 
+    - Mission and objectives. 
+    - Market Analysis: 
+    - Analysis of the AI market segment. 
+    - Growth trends and opportunities. 
+    - Competitive landscape. 
+    - Business Model: 
+        - Description of the AI startup's business model. 
+        - Revenue streams. 
+        - Cost structure. 
+    - Financial Performance: 
+        - Revenue analysis: 
+        - Revenue growth over time. 
+    - Revenue sources (e.g., product sales, subscriptions, services). 
+        - Profitability analysis: 
+        - Gross profit margin. 
+        - Operating profit margin. 
+        - Net profit margin. 
+    - Cash flow analysis: 
+        - Operating cash flow. 
+        - Investing cash flow. 
+        - Financing cash flow. 
+    - Balance sheet analysis: 
+        - Assets composition. 
+        - Liabilities and equity. 
+    - Key financial ratios: 
+        - Return on Investment (ROI). 
+        - Return on Equity (ROE). 
+        - Debt-to-Equity ratio. 
+        - Current ratio. 
+        - Quick ratio. 
+    - Investment Analysis: 
+        - Valuation: 
+            - Methods used (e.g., Discounted Cash Flow, Comparable Company Analysis). 
+            - Assumptions and inputs. 
+    - Investment risks: 
+        - Market risks. 
+        - Technology risks. 
+        - Regulatory risks. 
+    - Strategic Initiatives: 
+        - Expansion plans. 
+        - Research and development efforts. 
+        - Strategic partnerships. 
+    - Conclusion: 
+        - Summary of key findings. 
+        - Recommendations for investors. 
+        - Future outlook. 
+    - Appendix: 
+        - Detailed financial tables. 
+        - Glossary of financial terms. 
+        - References: 
+    - Sources of information used in the report. \nToday is the: """) +str(today)+""" .""",
+  }
+
+
+def crew_config(base_url, agents, tasks, parallel=False, compact_tokens=0, checkpoints=False, description=""):
+  """Collect everything which is needed to build a crew.
+
+  agents maps every role to a dict with model, temperature, max_iterations,
+  role, goal and backstory. tasks maps every role to its task description.
+  With parallel the tasks run as a graph, see TASK_DEPENDENCIES. With
+  compact_tokens the results handed to the next task are shortened to about
+  this many tokens. With checkpoints every finished task is saved in the run
+  store and unchanged tasks are taken from there."""
+  return {"base_url": base_url, "agents": agents, "tasks": tasks, "parallel": parallel,
+          "compact_tokens": compact_tokens, "checkpoints": checkpoints, "description": description}
+
+
+def route_agents(config, pool):
+  """Pick an Ollama host of the pool for every agent. Returns the (host, model)
+  pairs which should be warmed up before the crew starts."""
+  for settings in config["agents"].values():
+    settings["base_url"] = pool.pick(settings["model"])
+    # Every real generation sets how long the model stays loaded, so it must
+    # be the same as for the warm up.
+    settings["keep_alive"] = pool.keep_alive
+  return [(settings["base_url"], settings["model"]) for settings in config["agents"].values()]
+
+
+# The tasks whose results a task needs. The sequential crew hands every task
+# only the result of the task right before it.
+TASK_DEPENDENCIES = {
+    "researcher": (),
+    "consultant": ("researcher",),
+    "autor": ("researcher",),
+}
+
+# The order in which the results of the parallel tasks make up the report.
+REPORT_ORDER = ("autor", "consultant")
+
+# The same tasks one after the other, like the sequential crew: every task
+# only gets the result of the task before it. It is used when the results
+# are compacted between the tasks.
+SEQUENTIAL_DEPENDENCIES = {
+    "researcher": (),
+    "consultant": ("researcher",),
+    "autor": ("consultant",),
+}
+
+
+def build_agent(config, name, tools, allow_delegation, step_callback, trace=None, stream=None):
+  from crewai import Agent
+  from tools.ollama_llm import CachedOllama, TokenStreamHandler, TokenUsageHandler
+  settings = config["agents"][name]
+  # An agent which was routed by an OllamaPool has its own host.
+  base_url = settings.get("base_url") or config["base_url"]
+  callbacks = []
+  if trace is not None:
+    callbacks.append(TokenUsageHandler(trace, name))
+  # The tokens are passed on while they are generated, e.g. to show them live.
+  if stream is not None:
+    callbacks.append(TokenStreamHandler(stream, name))
+  callbacks = callbacks or None
+  llm = CachedOllama(model=settings["model"], base_url=base_url, temperature=settings["temperature"],
+                     keep_alive=settings.get("keep_alive"), callbacks=callbacks)
+  if trace is not None:
+    step_callback = traced_step_callback(trace, name, step_callback)
+  return Agent(
+    max_inter=settings["max_iterations"],
+    role=settings["role"],
+    goal=settings["goal"],
+    backstory=settings["backstory"],
+    verbose=True,
+    allow_delegation=allow_delegation,
+    tools=tools,
+    llm=llm,
+    step_callback=step_callback
+  )
+
+
+def traced_step_callback(trace, name, step_callback):
+  # Records the time of every step of the agent before the step is shown.
+  def callback(step_output):
+    trace.step(name)
+    if step_callback is not None:
+      step_callback(step_output)
+  return callback
+
+
+def build_agents(config, step_callback=None, trace=None, stream=None):
+  from tools.calculator_tools import CalculatorTools
+  from tools.search_tools import web_search
+  # One tool searches Serper and DuckDuckGo at once, the agents need half of
+  # the steps compared to calling both engines one after the other.
+  search_tools = [
+      web_search,
+  ]
+  researcher = build_agent(config, "researcher", search_tools, True, step_callback, trace, stream)
+  # The consultant compares startups and gets the calculator for its ratios.
+  calculator_tools = [
+      CalculatorTools.calculate,
+      CalculatorTools.calculate_batch,
+  ]
+  consultant = build_agent(config, "consultant", search_tools + calculator_tools, False, step_callback, trace, stream)
+  autor = build_agent(config, "autor", [], False, step_callback, trace, stream)
+  return {"researcher": researcher, "consultant": consultant, "autor": autor}
+
+
+def build_tasks(config, agents):
+  from crewai import Task
+
+  # Create tasks for your agents
+  task1 = Task(
+    description=config["tasks"]["researcher"],
+    agent=agents["researcher"],
+    expected_output="Do my work please"
+  )
+
+  task2 = Task(
+    description=config["tasks"]["autor"],
+    agent=agents["autor"],
+    expected_output="Do my work please"
+  )
+
+  task3 = Task(
+    description=config["tasks"]["consultant"],
+    agent=agents["consultant"],
+    expected_output="Do my work please"
+  )
+  return {"researcher": task1, "consultant": task3, "autor": task2}
+
+
+def build_crew(config, step_callback=None, trace=None, stream=None):
+  """Create the agents, their tasks and the crew. With a RunTrace the steps,
+  LLM calls and tool calls of the agents are timed, with a TokenStream the
+  tokens of the agents are passed on while they are generated."""
+  from crewai import Crew
+  agents = build_agents(config, step_callback, trace, stream)
+  tasks = build_tasks(config, agents)
+
+  return Crew(
+    agents=[agents["researcher"], agents["consultant"], agents["autor"]],
+    tasks=[tasks["researcher"], tasks["consultant"], tasks["autor"]],
+    verbose=2, # You can set it to 1 or 2 to different logging levels
+  )
+
+
+def build_task_graph(config, step_callback=None, trace=None, stream=None, run_id=None):
+  """The tasks of the crew as a TaskGraph. In parallel mode the business angel
+  and the autor only need the report of the researcher, so they run at the
+  same time. Otherwise the tasks run one after the other. With checkpoints
+  a task whose key is in the run store is not run again."""
+  from crewai.tools.agent_tools import AgentTools
+  from tools.compaction import ContextCompactor
+  from tools.run_store import get_run_store, task_keys
+  from tools.task_graph import TaskGraph
+  agents = build_agents(config, step_callback, trace, stream)
+  tasks = build_tasks(config, agents)
+  # The crew gives an agent which may delegate the tools to ask the other
+  # agents, like Crew._run_sequential_process does. Only the researcher may
+  # delegate and it runs before every other task, so the agents it asks are
+  # never busy with their own task.
+  for role, task in tasks.items():
+    if agents[role].allow_delegation:
+      others = [agent for name, agent in agents.items() if name != role]
+      task.tools = list(task.tools or []) + AgentTools(agents=others).tools()
+  compactor = ContextCompactor(config["compact_tokens"]) if config.get("compact_tokens") else None
+  dependencies = TASK_DEPENDENCIES if config.get("parallel") else SEQUENTIAL_DEPENDENCIES
+  store = get_run_store() if config.get("checkpoints") else None
+  keys = task_keys(config, dependencies)
+
+  def execute(role):
+    def run(inputs):
+      if store is not None:
+        saved = store.checkpoint(keys[role])
+        if saved is not None:
+          store.use_checkpoint(run_id, role, keys[role])
+          if trace is not None:
+            trace.record("checkpoint", role, 0.0)
+          return saved
+      # The trace of the run is bound to the thread, every task runs in its own.
+      with trace if trace is not None else nullcontext():
+        if compactor is not None:
+          inputs = compactor(inputs, role, trace)
+        context = "\n\n".join(inputs.values()) or None
+        output = str(tasks[role].execute(context=context))
+      if store is not None:
+        store.save_checkpoint(run_id, role, keys[role], dict(inputs), output)
+      return output
+    return run
+
+  graph = TaskGraph()
+  for role in ROLES:
+    graph.add(role, execute(role), dependencies[role])
+  return graph
+
+
+def run_task_graph(config, step_callback=None, trace=None, stream=None, run_id=None):
+  """Run the tasks as a graph. In parallel mode the results of the last tasks
+  are merged into one report, always in the order of REPORT_ORDER, otherwise
+  the result of the autor is the report."""
+  from tools.run_store import get_run_store
+  store = get_run_store() if config.get("checkpoints") else None
+  run_id = run_id or (trace.run_id if trace is not None else uuid.uuid4().hex[:12])
+  if store is not None:
+    store.start_run(run_id, config, config.get("description", ""))
+  try:
+    results = build_task_graph(config, step_callback, trace, stream, run_id).run()
+  except Exception:
+    if store is not None:
+      store.finish_run(run_id, "failed")
+    raise
+  report_order = REPORT_ORDER if config.get("parallel") else ("autor",)
+  result = "\n\n".join(results[role] for role in report_order)
+  if store is not None:
+    store.finish_run(run_id, "done", result)
+  print("######################")
+  print(result)
+  return result
+
+
+def run_crew(config, step_callback=None, trace=None, stream=None, run_id=None):
+  """Build the crew and run it. Returns the final result. With the parallel
+  option of the config independent tasks run at the same time. The crewAI
+  crew hands the results on as they are, to compact them or to save them as
+  checkpoints the tasks run as a graph as well."""
+  if config.get("parallel") or config.get("compact_tokens") or config.get("checkpoints"):
+    return run_task_graph(config, step_callback, trace, stream, run_id)
+  crew = build_crew(config, step_callback, trace, stream)
+  # The tools find the trace of the run through the current thread.
+  with trace if trace is not None else nullcontext():
+    result = crew.kickoff()
+  print("######################")
+  print(result)
+  return result
@@ -1,38 +1,131 @@
+import hashlib
 import json
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
-import streamlit as st
-from crewai import Agent, Task
 from langchain.tools import tool
-from unstructured.partition.html import partition_html
+
+from tools.chunking import Chunker
+from tools.html_extract import extract_blocks
+from tools.http_client import RateLimited, request
+from tools.instrumentation import timed_tool
+from tools.relevance_index import get_relevance_index
+from tools.result_cache import get_page_cache
+from tools.settings import get_flag, get_setting
+from tools.summarizer import get_summarizer, summary_chunker
+
+# Asks the websites for their ETag and Last-Modified while browserless renders them.
+_validator_executor = ThreadPoolExecutor(max_workers=4)
+
+
+def page_budget():
+  """How many characters of a page are extracted at most, from
+  SCRAPE_MAX_CHARS or SCRAPE_MAX_TOKENS (about four characters a token)."""
+  budget = int(get_setting("SCRAPE_MAX_CHARS", 60000))
+  tokens = get_setting("SCRAPE_MAX_TOKENS")
+  return min(budget, int(tokens) * 4) if tokens else budget
+
+
+def page_validators(website, cached=None):
+  """The ETag and Last-Modified of the website from a HEAD request. With a
+  cached entry the request is conditional, a 304 answer keeps its validators."""
+  headers = {}
+  if cached and cached.get("etag"):
+    headers["If-None-Match"] = cached["etag"]
+  if cached and cached.get("last_modified"):
+    headers["If-Modified-Since"] = cached["last_modified"]
+  response = request("HEAD", website, headers=headers, timeout=(3, 10), allow_redirects=True)
+  if response.status_code == 304 and cached:
+    return {"etag": cached.get("etag"), "last_modified": cached.get("last_modified"), "unchanged": True}
+  validators = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+  unchanged = bool(cached) and any(validators.values()) and all(
+      validators[name] == cached.get(name) for name in ("etag", "last_modified") if validators[name])
+  return dict(validators, unchanged=unchanged)
+
+
+def fetch_page_blocks(website):
+  """The text blocks of the main content of the website.
+
+  The rendered page is read from browserless as a stream and only the main
+  content is extracted until the budget is used up, the rest of a huge page
+  is never downloaded. The blocks are cached per url. A cached page is used
+  again as long as its ETag or Last-Modified did not change."""
+  cache = get_page_cache()
+  cached = cache.get("page", website)
+  cached = json.loads(cached) if cached else None
+  if cached and (cached.get("etag") or cached.get("last_modified")) and get_flag("PAGE_REVALIDATE", True):
+    try:
+      if page_validators(website, cached)["unchanged"]:
+        return cached["blocks"]
+    except requests.RequestException:
+      # The website does not answer HEAD requests, the cached text is still good.
+      return cached["blocks"]
+  elif cached:
+    # Without validators the entry is used until it expires.
+    return cached["blocks"]
+
+  validators = _validator_executor.submit(page_validators, website) if get_flag("PAGE_REVALIDATE", True) else None
+  url = f"{get_setting('BROWSERLESS_URL', 'https://chrome.browserless.io')}/content?token={get_setting('BROWSERLESS_API_KEY')}"
+  payload = json.dumps({"url": website})
+  headers = {'cache-control': 'no-cache', 'content-type': 'application/json'}
+  response = request("POST", url, provider="browserless", headers=headers, data=payload, stream=True)
+  try:
+    # An error page of browserless, e.g. for a wrong api key, must never be
+    # taken for the content of the website and cached. The url is not in the
+    # message, it holds the api key.
+    if response.status_code >= 400:
+      raise requests.HTTPError(f"browserless answered with status {response.status_code}", response=response)
+    blocks = extract_blocks(response.iter_content(chunk_size=16384), max_chars=page_budget(),
+                            encoding=response.encoding or "utf-8")
+  finally:
+    # Closing the stream early drops the rest of the page.
+    response.close()
+  try:
+    # A website which is slow to answer is cached without validators.
+    entry = validators.result(timeout=2) if validators is not None else {}
+  except Exception:
+    entry = {}
+  if blocks:
+    cache.put("page", website, json.dumps({
+        "etag": entry.get("etag"), "last_modified": entry.get("last_modified"), "blocks": blocks}))
+  return blocks
 
 
 class BrowserTools():
 
   @tool("Scrape website content")
-  def scrape_and_summarize_website(website):
-    """Useful to scrape and summarize a website content"""
-    url = f"https://chrome.browserless.io/content?token={st.secrets['BROWSERLESS_API_KEY']}"
-    payload = json.dumps({"url": website})
-    headers = {'cache-control': 'no-cache', 'content-type': 'application/json'}
-    response = requests.request("POST", url, headers=headers, data=payload)
-    elements = partition_html(text=response.text)
-    content = "\n\n".join([str(el) for el in elements])
-    content = [content[i:i + 8000] for i in range(0, len(content), 8000)]
-    summaries = []
-    for chunk in content:
-      agent = Agent(
-          role='Principal Researcher',
-          goal=
-          'Do amazing researches and summaries based on the content you are working with',
-          backstory=
-          "You're a Principal Researcher at a big company and you need to do a research about a given topic.",
-          allow_delegation=False)
-      task = Task(
-          agent=agent,
-          description=
-          f'Analyze and summarize the content bellow, make sure to include the most relevant information in the summary, return only the summary nothing else.\n\nCONTENT\n----------\n{chunk}'
-      )
-      summary = task.execute()
-      summaries.append(summary)
-    return "\n\n".join(summaries)
+  @timed_tool("scrape_website")
+  def scrape_and_summarize_website(website, query=""):
+    """Useful to scrape and summarize a website content. Besides the website
+    url you can pass a query with what you are looking for on that website,
+    then only the relevant parts of the website are summarized."""
+    index = get_relevance_index()
+    # The page cache revalidates the page with its ETag / Last-Modified. The
+    # index keeps the chunks of the page as long as its text is the same.
+    try:
+      blocks = fetch_page_blocks(website)
+    except (RateLimited, requests.RequestException) as e:
+      if not index.has_page(website):
+        if isinstance(e, RateLimited):
+          return "The website can not be scraped right now because too many pages are scraped at once, please try again in a moment."
+        return f"The website could not be scraped: {e}"
+      # The page which is already indexed is still good enough.
+      blocks = None
+    if blocks is not None:
+      version = hashlib.sha256(json.dumps(blocks).encode("utf-8")).hexdigest()
+      if not index.has_page(website, version):
+        # The page is split on element and sentence boundaries into small
+        # chunks for the index, repeated teasers and near duplicates only once.
+        chunker = Chunker(max_tokens=int(get_setting("RELEVANCE_CHUNK_TOKENS", 500)),
+                          overlap_tokens=int(get_setting("CHUNK_OVERLAP_TOKENS", 50)),
+                          dedupe_threshold=float(get_setting("CHUNK_DEDUPE_THRESHOLD", 0.8)))
+        chunks = chunker.chunks(blocks)
+        if not chunks:
+          # Nothing is indexed, the next call tries the website again.
+          return "No content could be extracted from the website."
+        index.add_page(website, chunks, version)
+    relevant = index.search(website, query, top_k=int(get_setting("RELEVANCE_TOP_K", 4)))
+    # Only the relevant chunks are packed into chunks which fill the context
+    # window of the summary model and summarized in parallel by the shared
+    # summarizer.
+    return get_summarizer().summarize(summary_chunker().chunks(relevant))
@@ -1,13 +1,211 @@
+import ast
+import json
+import math
+import operator
+from functools import lru_cache
+
 from langchain.tools import tool
 
+from tools.instrumentation import timed_tool
+
+# NumPy is optional, without it the batch mode evaluates row by row.
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+MAX_EXPONENT = 1000
+# Results with more digits are rejected. The exponent limit alone lets
+# nested powers like (9**999)**999 through, and repeated products like
+# a1 = a0*a0, a2 = a1*a1 double the digits at every step.
+MAX_DIGITS = 1000
+MAX_BITS = int(MAX_DIGITS * 3.33)
+
+
+def _checked(value):
+  # Only integers can grow without bounds, floats become inf.
+  if isinstance(value, int) and value.bit_length() > MAX_BITS:
+    raise ValueError("the result is too big")
+  return value
+
+
+def _power(base, exponent):
+  # 9**9**9 would keep the agent busy forever.
+  if np is not None and isinstance(exponent, np.ndarray):
+    if np.any(np.abs(exponent) > MAX_EXPONENT):
+      raise ValueError("exponent is too big")
+  elif abs(exponent) > MAX_EXPONENT:
+    raise ValueError("exponent is too big")
+  # NumPy computes with floats, a result which is too big becomes inf.
+  arrays = np is not None and (isinstance(base, np.ndarray) or isinstance(exponent, np.ndarray))
+  if not arrays and base != 0 and exponent * math.log10(abs(base)) > MAX_DIGITS:
+    raise ValueError("the result is too big")
+  return operator.pow(base, exponent)
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: _power,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+# The functions an expression may call, for single values and for NumPy arrays.
+FUNCTIONS = {
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "log": math.log,
+    "log10": math.log10,
+    "exp": math.exp,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}
+
+if np is not None:
+  ARRAY_FUNCTIONS = {
+      "abs": np.abs,
+      "round": np.round,
+      "min": np.minimum,
+      "max": np.maximum,
+      "sqrt": np.sqrt,
+      "log": np.log,
+      "log10": np.log10,
+      "exp": np.exp,
+      "floor": np.floor,
+      "ceil": np.ceil,
+  }
+
+
+def _compile(node):
+  """Turn a node of the syntax tree into a function of (variables, functions).
+  Everything which is not in the white lists is rejected."""
+  if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+    value = node.value
+    return lambda variables, functions: value
+  if isinstance(node, ast.Name):
+    name = node.id
+    if name in CONSTANTS:
+      value = CONSTANTS[name]
+      return lambda variables, functions: value
+
+    def lookup(variables, functions):
+      if name not in variables:
+        raise ValueError(f"unknown variable '{name}'")
+      return variables[name]
+
+    return lookup
+  if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+    function = BINARY_OPERATORS[type(node.op)]
+    left, right = _compile(node.left), _compile(node.right)
+    return lambda variables, functions: _checked(function(left(variables, functions), right(variables, functions)))
+  if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+    function = UNARY_OPERATORS[type(node.op)]
+    operand = _compile(node.operand)
+    return lambda variables, functions: function(operand(variables, functions))
+  if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FUNCTIONS and not node.keywords:
+    name = node.func.id
+    arguments = [_compile(argument) for argument in node.args]
+    return lambda variables, functions: functions[name](*[argument(variables, functions) for argument in arguments])
+  raise ValueError(f"{type(node).__name__} is not allowed in a calculation")
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(expression):
+  """Parse and compile an arithmetic expression once, repeated expressions
+  come from the cache."""
+  try:
+    tree = ast.parse(expression.strip(), mode="eval")
+  except SyntaxError as e:
+    raise ValueError(f"'{expression}' is no valid expression: {e.msg}")
+  return _compile(tree.body)
+
+
+def evaluate(expression, variables=None):
+  """Evaluate one expression like `200*7` or `revenue / employees`."""
+  return compile_expression(expression)(variables or {}, FUNCTIONS)
+
+
+def evaluate_batch(expressions, variables=None):
+  """Evaluate many expressions at once.
+
+  expressions is a dict of name -> expression (or a list, then the expressions
+  are their own names). Later expressions can use the results of earlier ones.
+  The variables can be single numbers or columns of a table, i.e. lists of the
+  same length. Columns are evaluated vectorized with NumPy if it is installed."""
+  if isinstance(expressions, (list, tuple)):
+    expressions = {str(expression): expression for expression in expressions}
+  variables = dict(variables or {})
+  columns = {name for name, value in variables.items() if isinstance(value, (list, tuple))}
+  if len({len(variables[name]) for name in columns}) > 1:
+    lengths = ", ".join(f"{name}: {len(variables[name])}" for name in sorted(columns))
+    raise ValueError(f"all columns must have the same length ({lengths})")
+  results = {}
+  if columns and np is not None:
+    scope = {name: np.asarray(value, dtype=float) if name in columns else value for name, value in variables.items()}
+    for name, expression in expressions.items():
+      value = compile_expression(expression)(scope, ARRAY_FUNCTIONS)
+      scope[name] = value
+      results[name] = value.tolist() if isinstance(value, np.ndarray) else value
+    return results
+  if columns:
+    # Without NumPy the table is evaluated row by row.
+    rows = len(next(iter(variables[name] for name in columns)))
+    row_scopes = [{name: value[row] if name in columns else value for name, value in variables.items()} for row in range(rows)]
+    for name, expression in expressions.items():
+      function = compile_expression(expression)
+      values = [function(scope, FUNCTIONS) for scope in row_scopes]
+      for scope, value in zip(row_scopes, values):
+        scope[name] = value
+      results[name] = values
+    return results
+  for name, expression in expressions.items():
+    variables[name] = results[name] = evaluate(expression, variables)
+  return results
+
 
 class CalculatorTools():
 
   @tool("Make a calcualtion")
+  @timed_tool("calculate")
   def calculate(operation):
-    """Useful to perform any mathematical calculations, 
+    """Useful to perform any mathematical calculations,
     like sum, minus, multiplication, division, etc.
-    The input to this tool should be a mathematical 
+    The input to this tool should be a mathematical
     expression, a couple examples are `200*7` or `5000/2*10`
     """
-    return eval(operation)
+    try:
+      # The result is turned into text here, a conversion error is an error
+      # of the calculation as well.
+      return str(evaluate(operation))
+    except (ValueError, ArithmeticError, TypeError) as e:
+      return f"Error: {e}"
+
+  @tool("Make many calculations at once")
+  @timed_tool("calculate_batch")
+  def calculate_batch(batch):
+    """Useful to calculate many values in one go, e.g. a set of financial
+    ratios for several startups. The input is a JSON object with
+    "expressions" (name -> expression) and optional "variables" (name -> number
+    or list of numbers, one per row), for example
+    {"expressions": {"margin": "profit / revenue * 100"},
+     "variables": {"profit": [10, 4], "revenue": [100, 50]}}
+    """
+    try:
+      data = json.loads(batch) if isinstance(batch, str) else batch
+      results = evaluate_batch(data["expressions"], data.get("variables"))
+      return "\n".join(f"{name} = {value}" for name, value in results.items())
+    except (ValueError, KeyError, TypeError, ArithmeticError) as e:
+      return f"Error: {e}"
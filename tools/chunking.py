@@ -0,0 +1,183 @@
+import math
+import re
+import threading
+import zlib
+
+from tools.http_client import request_json
+from tools.settings import get_setting
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+WORD = re.compile(r"\w+")
+
+# Ollama answers with a context of num_ctx tokens, 2048 unless the model file
+# or the request sets another value.
+DEFAULT_NUM_CTX = 2048
+
+_windows = {}
+_windows_lock = threading.Lock()
+
+
+def estimate_tokens(text):
+  """A rough token count, about four characters per token for the Llama
+  family of models."""
+  return math.ceil(len(text) / 4)
+
+
+def context_window(model, base_url):
+  """The context window in tokens Ollama uses for the model, from /api/show.
+  The num_ctx of the model file wins, the context length the model was
+  trained with is the upper bound. Cached per host and model."""
+  key = (base_url.rstrip("/"), model)
+  with _windows_lock:
+    if key in _windows:
+      return _windows[key]
+  window = int(get_setting("OLLAMA_NUM_CTX", DEFAULT_NUM_CTX))
+  try:
+    data = request_json("POST", f"{key[0]}/api/show", json={"name": model}, timeout=(3, 10))
+  except Exception:
+    # The default is safe for every model, it is not cached so the next call
+    # asks again.
+    return window
+  match = re.search(r"num_ctx\s+(\d+)", str(data.get("parameters") or ""))
+  if match:
+    window = int(match.group(1))
+  trained = [value for name, value in (data.get("model_info") or {}).items() if name.endswith(".context_length")]
+  if trained:
+    window = min(window, int(trained[0]))
+  with _windows_lock:
+    _windows[key] = window
+  return window
+
+
+def split_sentences(text):
+  return [sentence for sentence in SENTENCE_END.split(text.strip()) if sentence]
+
+
+def split_units(blocks, max_tokens):
+  """Split html elements or paragraphs into parts of at most max_tokens. A
+  block is only split if it is too long: first into sentences, a sentence
+  which is still too long into words."""
+  units = []
+  for block in blocks:
+    text = str(block).strip()
+    if not text:
+      continue
+    if estimate_tokens(text) <= max_tokens:
+      units.append(text)
+      continue
+    for sentence in split_sentences(text):
+      if estimate_tokens(sentence) <= max_tokens:
+        units.append(sentence)
+        continue
+      words = sentence.split()
+      part = []
+      for word in words:
+        if part and estimate_tokens(" ".join(part + [word])) > max_tokens:
+          units.append(" ".join(part))
+          part = []
+        part.append(word)
+      if part:
+        units.append(" ".join(part))
+  return units
+
+
+# MinHash over word shingles. Every permutation is a*h + b modulo a prime.
+_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [((i * 0x9E3779B1 + 1) % _PRIME, (i * 0x85EBCA77 + 7) % _PRIME) for i in range(1, 65)]
+
+
+def minhash(text, shingle_size=3):
+  words = WORD.findall(text.lower())
+  shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+  hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+  return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def dedupe(texts, threshold=0.8):
+  """Drop texts which are near duplicates of an earlier text, i.e. share
+  more than threshold of their MinHash signature."""
+  kept = []
+  signatures = []
+  for text in texts:
+    signature = minhash(text)
+    if any(sum(x == y for x, y in zip(signature, other)) / len(signature) >= threshold for other in signatures):
+      continue
+    kept.append(text)
+    signatures.append(signature)
+  return kept
+
+
+class Chunker():
+  """Packs html elements or paragraphs into chunks of up to max_tokens.
+
+  Elements are only split when they do not fit into a chunk on their own,
+  then on sentence boundaries. Each chunk starts with up to overlap_tokens of
+  the end of the chunk before it, whole elements or the last sentences of
+  an element, so a fact on a boundary is seen completely in one of them.
+  Near duplicate elements and chunks, like repeated teasers on a page, are
+  dropped."""
+
+  def __init__(self, max_tokens=500, overlap_tokens=0, dedupe_threshold=0.8):
+    self.max_tokens = max(1, max_tokens)
+    self.overlap_tokens = min(overlap_tokens, self.max_tokens // 2)
+    self.dedupe_threshold = dedupe_threshold
+
+  def chunks(self, blocks):
+    units = split_units(blocks, self.max_tokens)
+    if self.dedupe_threshold:
+      units = dedupe(units, self.dedupe_threshold)
+    chunks = []
+    current = []
+    size = 0
+    for unit in units:
+      # One more token for the blank line between two elements.
+      tokens = estimate_tokens(unit) + 1
+      if current and size + tokens > self.max_tokens:
+        chunks.append("\n\n".join(current))
+        current, size = self._overlap(current, tokens)
+      current.append(unit)
+      size += tokens
+    if current:
+      chunks.append("\n\n".join(current))
+    if self.dedupe_threshold:
+      chunks = dedupe(chunks, self.dedupe_threshold)
+    return chunks
+
+  def _overlap(self, units, next_tokens):
+    # The end of the chunk which fits into the overlap and leaves room for the
+    # next unit. An element which does not fit as a whole gives its last
+    # sentences.
+    budget = min(self.overlap_tokens, self.max_tokens - next_tokens)
+    kept = []
+    size = 0
+    for unit in reversed(units):
+      tokens = estimate_tokens(unit) + 1
+      if size + tokens <= budget:
+        kept.insert(0, unit)
+        size += tokens
+        continue
+      sentences = []
+      for sentence in reversed(split_sentences(unit)):
+        tokens = estimate_tokens(" ".join([sentence] + sentences)) + 1
+        if size + tokens > budget:
+          break
+        sentences.insert(0, sentence)
+      if sentences:
+        kept.insert(0, " ".join(sentences))
+        size += estimate_tokens(kept[0]) + 1
+      break
+    return kept, size
+
+
+def model_chunker(model, base_url, reserved_tokens=0, overlap_tokens=None):
+  """A Chunker whose chunks fill the context window of the Ollama model,
+  minus the reserved tokens for the prompt around the chunk and the answer.
+  Without a model the chunks have CHUNK_MAX_TOKENS tokens."""
+  if overlap_tokens is None:
+    overlap_tokens = int(get_setting("CHUNK_OVERLAP_TOKENS", 50))
+  if model:
+    max_tokens = max(256, context_window(model, base_url) - reserved_tokens)
+  else:
+    max_tokens = int(get_setting("CHUNK_MAX_TOKENS", 2000))
+  return Chunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens,
+                 dedupe_threshold=float(get_setting("CHUNK_DEDUPE_THRESHOLD", 0.8)))
@@ -0,0 +1,81 @@
+import math
+import re
+
+from tools.chunking import dedupe, estimate_tokens, split_sentences
+
+URL = re.compile(r"https?://\S+|www\.\S+")
+NUMBER = re.compile(r"\d[\d.,]*\s*(?:%|million|mio|billion|bn|k|m|€|\$|eur|usd)?", re.IGNORECASE)
+# Capitalized words which do not start a sentence are most likely names.
+NAME = re.compile(r"(?<=[\w,;:(] )[A-Z][\w&.-]+|\"[^\"]{2,60}\"")
+FIELD = re.compile(r"^\s*(?:[-*]|\d+\.)?\s*[\w ]{2,30}:\s*\S")
+
+
+def units(text):
+  """Split a text into the parts which are kept or dropped as a whole: list
+  items, table rows and headings stay lines, paragraphs are split into
+  sentences."""
+  parts = []
+  for line in text.splitlines():
+    stripped = line.strip()
+    if not stripped:
+      continue
+    if stripped.startswith(("-", "*", "|", "#")) or FIELD.match(line) or re.match(r"^\d+\.", stripped):
+      parts.append(line.rstrip())
+    else:
+      parts.extend(split_sentences(stripped))
+  return parts
+
+
+def score(unit, position, count):
+  """Facts score high: URLs, numbers, names and "Key: value" fields. Earlier
+  parts win between equal ones, reports start with their summary."""
+  value = 4.0 * len(URL.findall(unit)) + 2.0 * len(NUMBER.findall(unit)) + 1.0 * len(NAME.findall(unit))
+  if FIELD.match(unit):
+    value += 2.0
+  if unit.lstrip().startswith("#"):
+    value += 1.5
+  return value / math.sqrt(estimate_tokens(unit)) + 0.5 * (1.0 - position / max(1, count))
+
+
+def compact(text, budget_tokens):
+  """Shorten the text to about budget_tokens tokens by keeping its most
+  informative parts in their original order. Texts within the budget are
+  returned unchanged."""
+  if budget_tokens <= 0 or estimate_tokens(text) <= budget_tokens:
+    return text
+  # Near duplicates, like a fact every agent repeats, are kept only once.
+  parts = dedupe(units(text))
+  ranked = sorted(range(len(parts)), key=lambda i: -score(parts[i], i, len(parts)))
+  keep = set()
+  used = 0
+  for i in ranked:
+    tokens = estimate_tokens(parts[i]) + 1
+    if used + tokens > budget_tokens:
+      continue
+    keep.add(i)
+    used += tokens
+  return "\n".join(parts[i] for i in sorted(keep))
+
+
+class ContextCompactor():
+  """Compacts the results of earlier tasks before they are handed to the next
+  task. The budget is shared by all results of one handoff and the savings are
+  recorded in the trace of the run."""
+
+  def __init__(self, budget_tokens):
+    self.budget_tokens = budget_tokens
+
+  def __call__(self, inputs, target, trace=None):
+    """inputs maps the name of every earlier task to its result, target is the
+    name of the task which gets them. Returns the compacted results."""
+    if not inputs:
+      return inputs
+    budget = self.budget_tokens // len(inputs)
+    compacted = {}
+    for source, text in inputs.items():
+      result = compact(text, budget)
+      if trace is not None:
+        trace.record("compaction", f"{source} -> {target}", 0.0,
+                     tokens_before=estimate_tokens(text), tokens_after=estimate_tokens(result))
+      compacted[source] = result
+    return compacted
@@ -0,0 +1,91 @@
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from tools.settings import get_setting
+
+
+class HostLimiter():
+  """Limits how many things run at the same time against one host.
+
+  A single GPU Ollama server gets slower for everybody if it is asked to work
+  on too many generations at once, so every host gets its own semaphore. The
+  limit is read from the setting with the given name."""
+
+  def __init__(self, setting_name, default_limit):
+    self.setting_name = setting_name
+    self.default_limit = default_limit
+    self._semaphores = {}
+    self._in_flight = {}
+    self._waiting = {}
+    self._lock = threading.Lock()
+
+  @staticmethod
+  def host(url):
+    parts = urlsplit(url)
+    return parts.netloc or url
+
+  def limit(self):
+    return max(1, int(get_setting(self.setting_name, self.default_limit)))
+
+  def _semaphore(self, host):
+    with self._lock:
+      if host not in self._semaphores:
+        self._semaphores[host] = threading.BoundedSemaphore(self.limit())
+        self._in_flight[host] = 0
+        self._waiting[host] = 0
+      return self._semaphores[host]
+
+  def try_acquire(self, url):
+    """Take a slot of the host of the url without waiting. Returns False if
+    the host is busy, a taken slot has to be given back with release."""
+    host = self.host(url)
+    if not self._semaphore(host).acquire(blocking=False):
+      return False
+    with self._lock:
+      self._in_flight[host] += 1
+    return True
+
+  def release(self, url):
+    host = self.host(url)
+    with self._lock:
+      self._in_flight[host] -= 1
+    self._semaphore(host).release()
+
+  @contextmanager
+  def slot(self, url):
+    """Block until the host of the url has a free slot and hold it."""
+    host = self.host(url)
+    semaphore = self._semaphore(host)
+    with self._lock:
+      self._waiting[host] += 1
+    try:
+      semaphore.acquire()
+    finally:
+      with self._lock:
+        self._waiting[host] -= 1
+    try:
+      with self._lock:
+        self._in_flight[host] += 1
+      yield
+    finally:
+      with self._lock:
+        self._in_flight[host] -= 1
+      semaphore.release()
+
+  def in_flight(self, url):
+    with self._lock:
+      return self._in_flight.get(self.host(url), 0)
+
+  def load(self, url):
+    """The running and the waiting things of the host of the url."""
+    host = self.host(url)
+    with self._lock:
+      return self._in_flight.get(host, 0) + self._waiting.get(host, 0)
+
+
+# Shared by everything in the process which sends generations to Ollama.
+ollama_requests = HostLimiter("OLLAMA_MAX_CONCURRENCY", 2)
+
+# Caps how many crews run against one Ollama host at the same time.
+crew_runs = HostLimiter("MAX_CREWS_PER_HOST", 1)
@@ -0,0 +1,128 @@
+import codecs
+import re
+from html.parser import HTMLParser
+
+# Elements which never hold the content of a page.
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "iframe", "form", "button", "select",
+             "nav", "footer", "header", "aside", "head"}
+# Elements which end a block of text.
+BLOCK_TAGS = {"p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr",
+              "pre", "blockquote", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Class names and ids of menus, banners and other boilerplate, like "nav",
+# "site-footer" or "cookie-banner". A wrapper like "header-fixed" is kept.
+BOILERPLATE = re.compile(
+    r"(?:\w+[-_])?(?:nav|navbar|menu|footer|header|sidebar|breadcrumbs?|cookies?|consent|banner|share|social|"
+    r"comments?|advert|ads|promo|newsletter|related|subscribe|popup|modal)"
+    r"(?:[-_](?:bar|banner|links|list|menu|nav|buttons|area|section|container))?", re.IGNORECASE)
+
+
+def is_boilerplate(attributes):
+  tokens = " ".join(attributes.get(name) or "" for name in ("class", "id", "role")).split()
+  return any(BOILERPLATE.fullmatch(token) for token in tokens)
+
+
+class ContentExtractor(HTMLParser):
+  """Collects the text blocks of the main content of an html page while it is
+  fed piece by piece.
+
+  Scripts, navigation, headers, footers and elements whose class or id looks
+  like boilerplate are skipped with everything inside them. Blocks which are
+  mostly link text, like lists of menu entries, are dropped as well. When
+  max_chars characters were collected the extractor is done and ignores the
+  rest of the page."""
+
+  def __init__(self, max_chars=60000, min_block_chars=2):
+    super().__init__(convert_charrefs=True)
+    self.max_chars = max_chars
+    self.min_block_chars = min_block_chars
+    self.blocks = []
+    self.size = 0
+    self.done = False
+    self._skip_depth = 0
+    self._stack = []
+    self._text = []
+    self._link_chars = 0
+    self._in_link = 0
+
+  def handle_starttag(self, tag, attrs):
+    if self.done or tag in VOID_TAGS:
+      if tag in ("br", "hr"):
+        self._flush()
+      return
+    attributes = dict(attrs)
+    skip = tag in SKIP_TAGS or is_boilerplate(attributes) or attributes.get("aria-hidden") == "true"
+    if self._skip_depth == 0 and skip and tag not in ("main", "article", "body", "html"):
+      self._flush()
+    if self._skip_depth or (skip and tag not in ("main", "article", "body", "html")):
+      self._skip_depth += 1
+      self._stack.append((tag, True))
+      return
+    self._stack.append((tag, False))
+    if tag in BLOCK_TAGS:
+      self._flush()
+    elif tag in ("td", "th") and self._text:
+      # The cells of a table row stay in one block.
+      self._text.append(" | ")
+    elif tag == "a":
+      self._in_link += 1
+
+  def handle_endtag(self, tag):
+    if self.done or tag in VOID_TAGS:
+      return
+    # Close everything up to the matching tag, html is often not well formed.
+    for index in range(len(self._stack) - 1, -1, -1):
+      if self._stack[index][0] == tag:
+        break
+    else:
+      return
+    while len(self._stack) > index:
+      closed, skipped = self._stack.pop()
+      if skipped:
+        self._skip_depth -= 1
+      elif closed == "a":
+        self._in_link = max(0, self._in_link - 1)
+    if not self._skip_depth and tag in BLOCK_TAGS:
+      self._flush()
+
+  def handle_data(self, data):
+    if self.done or self._skip_depth:
+      return
+    self._text.append(data)
+    if self._in_link:
+      self._link_chars += len(data.strip())
+
+  def _flush(self):
+    text = re.sub(r"\s+", " ", "".join(self._text)).strip()
+    link_chars = self._link_chars
+    self._text = []
+    self._link_chars = 0
+    if len(text) < self.min_block_chars:
+      return
+    # Link lists without much text around them are menus.
+    if link_chars > 0.6 * len(text) and len(text) < 300:
+      return
+    if self.size + len(text) > self.max_chars:
+      text = text[:max(0, self.max_chars - self.size)]
+      self.done = True
+    if text:
+      self.blocks.append(text)
+      self.size += len(text)
+
+  def close(self):
+    super().close()
+    if not self.done:
+      self._flush()
+
+
+def extract_blocks(pieces, max_chars=60000, encoding="utf-8"):
+  """Extract the content blocks from an iterable of html pieces, bytes or
+  text. Reading stops as soon as the budget is used up."""
+  extractor = ContentExtractor(max_chars=max_chars)
+  decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+  for piece in pieces:
+    extractor.feed(decoder.decode(piece) if isinstance(piece, bytes) else piece)
+    if extractor.done:
+      break
+  extractor.close()
+  return extractor.blocks
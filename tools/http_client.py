@@ -0,0 +1,118 @@
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tools.rate_limit import get_rate_limiter
+from tools.settings import get_setting
+
+# Connect and read timeout in seconds for all outbound calls.
+DEFAULT_TIMEOUT = (5, 60)
+# Server errors which are retried.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+_sessions = {}
+_session_lock = threading.Lock()
+
+
+def get_session(retries=True):
+  """Return the process wide requests session.
+
+  All tools share it, so the connections (and TLS handshakes) to a host are
+  kept alive and reused. Failed connections and server errors are retried a
+  few times with an exponential backoff. With retries=False a second session
+  without retries is returned, for calls which must fail fast."""
+  with _session_lock:
+    if retries not in _sessions:
+      retry = Retry(
+          total=int(get_setting("HTTP_RETRIES", 3)) if retries else 0,
+          backoff_factor=float(get_setting("HTTP_BACKOFF", 0.5)),
+          status_forcelist=RETRY_STATUSES,
+          allowed_methods=None,  # POST requests to the search APIs are retried as well
+          # A 429 is never retried here, request() slows the provider down.
+          respect_retry_after_header=False,
+          raise_on_status=False)
+      pool_size = int(get_setting("HTTP_POOL_SIZE", 10))
+      adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+      session = requests.Session()
+      session.mount("http://", adapter)
+      session.mount("https://", adapter)
+      _sessions[retries] = session
+    return _sessions[retries]
+
+
+class RateLimited(requests.RequestException):
+  """The provider still answered 429 after all retries."""
+
+
+def retry_after(response):
+  """Seconds from the Retry-After header of a response, None without one."""
+  value = response.headers.get("Retry-After")
+  if not value:
+    return None
+  try:
+    return max(0.0, float(value))
+  except ValueError:
+    pass
+  try:
+    return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+  except (TypeError, ValueError):
+    return None
+
+
+def request(method, url, timeout=None, provider=None, retries=True, **kwargs):
+  """Send a request with the shared session and a timeout.
+
+  Requests to a provider like "serper" go through its rate limiter. A 429
+  answer slows the provider down and the request is sent again, up to
+  RATE_LIMIT_RETRIES times, then RateLimited is raised. Connection errors and
+  5xx answers are retried here as well instead of in the session, so every
+  attempt takes a token of the provider."""
+  if timeout is None:
+    timeout = (float(get_setting("HTTP_CONNECT_TIMEOUT", DEFAULT_TIMEOUT[0])),
+               float(get_setting("HTTP_READ_TIMEOUT", DEFAULT_TIMEOUT[1])))
+  if provider is None:
+    return get_session(retries).request(method, url, timeout=timeout, **kwargs)
+  limiter = get_rate_limiter(provider)
+  throttle_retries = int(get_setting("RATE_LIMIT_RETRIES", 5))
+  error_retries = int(get_setting("HTTP_RETRIES", 3)) if retries else 0
+  backoff = float(get_setting("HTTP_BACKOFF", 0.5))
+  throttled = failed = 0
+  while True:
+    try:
+      with limiter.slot():
+        response = get_session(retries=False).request(method, url, timeout=timeout, **kwargs)
+    except (requests.ConnectionError, requests.Timeout):
+      if failed >= error_retries:
+        raise
+      failed += 1
+      time.sleep(backoff * 2 ** (failed - 1))
+      continue
+    if response.status_code == 429:
+      limiter.on_throttle(retry_after(response))
+      throttled += 1
+      if throttled > throttle_retries:
+        raise RateLimited(f"{provider} is rate limited, {throttled} requests got a 429 answer", response=response)
+      response.close()
+      continue
+    if response.status_code in RETRY_STATUSES and failed < error_retries:
+      failed += 1
+      response.close()
+      time.sleep(backoff * 2 ** (failed - 1))
+      continue
+    limiter.on_success()
+    return response
+
+
+def request_json(method, url, **kwargs):
+  """Send a request and return the parsed JSON body. The response is parsed
+  exactly once, an empty dict is returned if the body is no JSON object."""
+  response = request(method, url, **kwargs)
+  try:
+    data = response.json()
+  except ValueError:
+    return {}
+  return data if isinstance(data, dict) else {}
@@ -0,0 +1,162 @@
+import functools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tools.settings import get_setting
+
+_local = threading.local()
+
+
+def current_trace():
+  """The trace of the crew run in this thread, None outside of a run."""
+  return getattr(_local, "trace", None)
+
+
+class RunTrace():
+  """Collects the wall time and the token counts of one crew run.
+
+  Every event is a dict with its kind ("step", "llm", "tool" or "compaction"),
+  the agent or tool name and the seconds it took. LLM events also carry the
+  prompt and completion tokens reported by Ollama, compaction events the tokens
+  of a handed on result before and after it was compacted."""
+
+  def __init__(self, run_id):
+    self.run_id = run_id
+    self.started = time.time()
+    self.events = []
+    self._last_step = {}
+    self._lock = threading.Lock()
+
+  def __enter__(self):
+    _local.trace = self
+    return self
+
+  def __exit__(self, *exc):
+    _local.trace = None
+
+  def record(self, kind, name, seconds, **fields):
+    event = dict(kind=kind, name=name, seconds=round(seconds, 4), at=round(time.time() - self.started, 4), **fields)
+    with self._lock:
+      self.events.append(event)
+    metrics.observe(event)
+
+  def step(self, agent):
+    """Called after every step of an agent, the step took the time since the
+    previous step of the same agent."""
+    now = time.time()
+    with self._lock:
+      previous = self._last_step.get(agent, self.started)
+      self._last_step[agent] = now
+    self.record("step", agent, now - previous)
+
+  def summary(self):
+    """One row per agent and tool with calls, seconds and tokens."""
+    rows = {}
+    with self._lock:
+      events = list(self.events)
+    for event in events:
+      row = rows.setdefault((event["kind"], event["name"]), {
+          "kind": event["kind"], "name": event["name"], "calls": 0, "seconds": 0.0,
+          "prompt_tokens": 0, "completion_tokens": 0, "saved_tokens": 0})
+      row["calls"] += 1
+      row["seconds"] = round(row["seconds"] + event["seconds"], 4)
+      row["prompt_tokens"] += event.get("prompt_tokens", 0)
+      row["completion_tokens"] += event.get("completion_tokens", 0)
+      row["saved_tokens"] += event.get("tokens_before", 0) - event.get("tokens_after", 0)
+    return sorted(rows.values(), key=lambda row: (row["kind"], -row["seconds"]))
+
+  def to_json(self):
+    with self._lock:
+      events = list(self.events)
+    return json.dumps({"run_id": self.run_id, "started": self.started, "events": events, "summary": self.summary()}, indent=2)
+
+
+def timed_tool(name):
+  """Record the wall time of a tool function in the trace of the current run."""
+
+  def decorator(function):
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      started = time.time()
+      try:
+        return function(*args, **kwargs)
+      finally:
+        trace = current_trace()
+        if trace is not None:
+          trace.record("tool", name, time.time() - started)
+
+    return wrapper
+
+  return decorator
+
+
+class Metrics():
+  """Totals over all runs of the process in the Prometheus text format."""
+
+  def __init__(self):
+    self._counters = {}
+    self._lock = threading.Lock()
+
+  def _add(self, metric, labels, value):
+    key = (metric, tuple(sorted(labels.items())))
+    with self._lock:
+      self._counters[key] = self._counters.get(key, 0) + value
+
+  def observe(self, event):
+    labels = {"kind": event["kind"], "name": event["name"]}
+    self._add("crew_calls_total", labels, 1)
+    self._add("crew_seconds_total", labels, event["seconds"])
+    if event["kind"] == "llm":
+      self._add("crew_tokens_total", dict(labels, type="prompt"), event.get("prompt_tokens", 0))
+      self._add("crew_tokens_total", dict(labels, type="completion"), event.get("completion_tokens", 0))
+    if event["kind"] == "compaction":
+      self._add("crew_saved_tokens_total", labels, event.get("tokens_before", 0) - event.get("tokens_after", 0))
+
+  def prometheus_text(self):
+    with self._lock:
+      counters = sorted(self._counters.items())
+    lines = []
+    for metric in sorted({metric for (metric, _), _ in counters}):
+      lines.append(f"# TYPE {metric} counter")
+      for (name, labels), value in counters:
+        if name == metric:
+          label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+          lines.append(f"{metric}{{{label_text}}} {value}")
+    return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server():
+  """Serve /metrics on METRICS_PORT once per process. Nothing happens if the
+  port is not configured."""
+  global _server
+  port = get_setting("METRICS_PORT")
+  if not port:
+    return None
+  with _server_lock:
+    if _server is None:
+
+      class Handler(BaseHTTPRequestHandler):
+
+        def log_message(self, format, *args):
+          pass
+
+        def do_GET(self):
+          found = self.path.startswith("/metrics")
+          body = metrics.prometheus_text().encode("utf-8") if found else b""
+          self.send_response(200 if found else 404)
+          self.send_header("Content-Type", "text/plain; version=0.0.4")
+          self.send_header("Content-Length", str(len(body)))
+          self.end_headers()
+          self.wfile.write(body)
+
+      _server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+      threading.Thread(target=_server.serve_forever, daemon=True).start()
+    return _server
@@ -0,0 +1,192 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from tools.concurrency import crew_runs
+from tools.settings import get_setting
+from tools.step_log import StepLog
+
+class TokenStream():
+  """The text the agents are generating right now, token by token.
+
+  Appending only takes a lock and adds to a list, so the generating thread is
+  never slowed down by the page. The page reads a snapshot whenever it polls
+  the job, that renders many tokens at once. Only the last max_chars
+  characters of every generation are kept."""
+
+  def __init__(self, max_chars=4000):
+    self.max_chars = max_chars
+    self._generations = OrderedDict()
+    self._lock = threading.Lock()
+
+  def start(self, agent):
+    with self._lock:
+      self._generations[agent] = {"tokens": [], "chars": 0, "active": True}
+      self._generations.move_to_end(agent)
+
+  def append(self, agent, token):
+    with self._lock:
+      generation = self._generations.setdefault(agent, {"tokens": [], "chars": 0, "active": True})
+      generation["tokens"].append(token)
+      generation["chars"] += len(token)
+      if generation["chars"] > 2 * self.max_chars:
+        text = "".join(generation["tokens"])[-self.max_chars:]
+        generation["tokens"] = [text]
+        generation["chars"] = len(text)
+
+  def end(self, agent):
+    with self._lock:
+      if agent in self._generations:
+        self._generations[agent]["active"] = False
+
+  def snapshot(self, active_only=True):
+    """agent -> text of its latest generation, the latest agent comes last."""
+    with self._lock:
+      generations = [(agent, generation["active"], list(generation["tokens"])) for agent, generation in self._generations.items()]
+    return OrderedDict(
+        (agent, "".join(tokens)[-self.max_chars:])
+        for agent, active, tokens in generations if active or not active_only)
+
+
+class Job():
+  """One crew run in the background. The page reads the progress and the
+  result from here, so it can reattach to the job after a rerun."""
+
+  def __init__(self, hosts, description=""):
+    self.id = uuid.uuid4().hex[:12]
+    # The Ollama hosts the crew runs against, one per host.
+    hosts = [hosts] if isinstance(hosts, str) else hosts
+    self.hosts = list({crew_runs.host(url): url for url in hosts}.values())
+    self.description = description
+    self.status = "queued"
+    self.created = time.time()
+    self.started = None
+    self.finished = None
+    self.result = None
+    self.error = None
+    self.meta = {}
+    self.stream = TokenStream(int(get_setting("STREAM_MAX_CHARS", 4000)))
+    self.step_log = StepLog(
+        os.path.join(get_setting("STEP_LOG_DIR", ".cache/step_logs"), f"{self.id}.md"),
+        max_live=int(get_setting("STEP_LOG_LIVE", 30)),
+        max_chars=int(get_setting("STEP_LOG_MAX_CHARS", 4000)))
+
+  def add_step(self, step_output):
+    """Used as step_callback of the agents. It runs in the worker thread and
+    only records the step, the page renders it later."""
+    self.step_log.add(step_output)
+
+  @property
+  def done(self):
+    return self.status in ("done", "failed")
+
+  def runtime(self):
+    if self.started is None:
+      return 0.0
+    return (self.finished or time.time()) - self.started
+
+
+class JobRunner():
+  """Runs jobs in a pool of worker threads.
+
+  A job only gets a worker when every Ollama host it uses has a free crew
+  slot, until then it waits in the queue without blocking a worker. So jobs
+  for a busy host do not keep the jobs for another host from starting. Only
+  the latest max_jobs jobs are kept, finished ones are dropped first."""
+
+  def __init__(self, max_workers=4, max_jobs=100):
+    self.max_workers = max(1, max_workers)
+    self.max_jobs = max_jobs
+    self._running = 0
+    self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+    self._jobs = OrderedDict()
+    self._queue = []
+    self._lock = threading.Lock()
+
+  def submit(self, hosts, function, description="", meta=None):
+    """Run function(job) in the background and return the job id. hosts are
+    the urls of the Ollama hosts the job uses, or one url."""
+    job = Job(hosts, description)
+    job.meta.update(meta or {})
+    with self._lock:
+      self._jobs[job.id] = job
+      self._forget_old_jobs()
+      self._queue.append((job, function))
+    self._dispatch()
+    return job.id
+
+  def _dispatch(self):
+    # Start the queued jobs whose host has a free slot, the oldest first, as
+    # long as there are free workers.
+    with self._lock:
+      waiting = []
+      for job, function in self._queue:
+        if self._running < self.max_workers and self._acquire(job.hosts):
+          self._running += 1
+          self._executor.submit(self._run, job, function)
+        else:
+          waiting.append((job, function))
+      self._queue = waiting
+
+  def _forget_old_jobs(self):
+    for job_id in [job_id for job_id, job in self._jobs.items() if job.done]:
+      if len(self._jobs) <= self.max_jobs:
+        break
+      self._jobs.pop(job_id).step_log.delete()
+
+  @staticmethod
+  def _acquire(hosts):
+    # A crew slot on every host or none.
+    taken = []
+    for host in hosts:
+      if not crew_runs.try_acquire(host):
+        for url in taken:
+          crew_runs.release(url)
+        return False
+      taken.append(host)
+    return True
+
+  def _run(self, job, function):
+    # The crew slots of the hosts were taken by _dispatch.
+    job.status = "running"
+    job.started = time.time()
+    try:
+      job.result = function(job)
+      job.status = "done"
+    except Exception as e:
+      job.error = f"{e}\n\n{traceback.format_exc()}"
+      job.status = "failed"
+    finally:
+      job.finished = time.time()
+      for host in job.hosts:
+        crew_runs.release(host)
+      with self._lock:
+        self._running -= 1
+      self._dispatch()
+
+  def get(self, job_id):
+    with self._lock:
+      return self._jobs.get(job_id)
+
+  def jobs(self):
+    with self._lock:
+      return list(self._jobs.values())
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+  """Return the process wide job runner which is shared by all sessions."""
+  global _runner
+  with _runner_lock:
+    if _runner is None:
+      _runner = JobRunner(
+          max_workers=int(get_setting("JOB_WORKERS", 4)),
+          max_jobs=int(get_setting("JOB_HISTORY", 100)))
+    return _runner
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import requests
+
+from tools.http_client import request
+from tools.settings import get_setting
+
+
+class ModelCatalog():
+  """Keeps the list of models an Ollama server offers (/api/tags).
+
+  The catalog is loaded once per process and shared by all streamlit sessions.
+  When the data is older than the TTL it is refreshed in a background thread
+  and the last known catalog is served in the meantime. If Ollama is slow or
+  down the last known catalog simply stays in place and Ollama is asked
+  again in the background after retry_after seconds."""
+
+  def __init__(self, url, ttl=300, timeout=5, retry_after=30):
+    self.url = url
+    self.ttl = ttl
+    self.timeout = timeout
+    self.retry_after = retry_after
+    self.error = None
+    self._models = None
+    self._fetched_at = 0.0
+    self._failed_at = None
+    self._refreshing = False
+    self._lock = threading.Lock()
+
+  def _fetch(self):
+    # No retries, an unreachable host would block the page for every retry.
+    response = request("GET", self.url, timeout=self.timeout, retries=False)
+    response.raise_for_status()
+    return response.json()["models"]
+
+  def refresh(self):
+    """Fetch the catalog now. On failure the last known catalog is kept."""
+    try:
+      models = self._fetch()
+    except (requests.RequestException, ValueError, KeyError) as e:
+      with self._lock:
+        self.error = f"Failed to fetch data from {self.url}: {e}"
+        self._failed_at = time.monotonic()
+        self._refreshing = False
+      return False
+    with self._lock:
+      self._models = models
+      self._fetched_at = time.monotonic()
+      self._failed_at = None
+      self.error = None
+      self._refreshing = False
+    return True
+
+  def models(self):
+    """Return the model entries of the catalog, an empty list if Ollama was
+    never reachable."""
+    with self._lock:
+      now = time.monotonic()
+      models = self._models
+      failed = self._failed_at is not None and now - self._failed_at <= self.retry_after
+      # Only the very first call of the process waits for Ollama, every later
+      # fetch runs in the background and a failure is remembered for
+      # retry_after seconds, so the reruns of the page are never blocked.
+      wait = models is None and self._failed_at is None and not self._refreshing
+      start_refresh = not wait and not self._refreshing and not failed and (
+          models is None or now - self._fetched_at > self.ttl)
+      if wait or start_refresh:
+        self._refreshing = True
+    if wait:
+      self.refresh()
+      return self._models or []
+    if start_refresh:
+      threading.Thread(target=self.refresh, daemon=True).start()
+    return models or []
+
+  def names(self):
+    return [model["name"] for model in self.models()]
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_model_catalog(url):
+  """Return the process wide catalog for the given /api/tags URL."""
+  with _catalogs_lock:
+    if url not in _catalogs:
+      _catalogs[url] = ModelCatalog(
+          url,
+          ttl=float(get_setting("MODEL_CATALOG_TTL", 300)),
+          timeout=float(get_setting("MODEL_CATALOG_TIMEOUT", 5)),
+          retry_after=float(get_setting("MODEL_CATALOG_RETRY_AFTER", 30)))
+    return _catalogs[url]
@@ -0,0 +1,92 @@
+import json
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain_community.llms import Ollama
+from langchain_core.outputs import Generation, LLMResult
+
+from tools.concurrency import ollama_requests
+from tools.result_cache import get_llm_cache
+from tools.settings import get_flag
+
+
+class CachedOllama(Ollama):
+  """Ollama which answers repeated prompts from a persistent cache.
+
+  The cache is only used for deterministic settings, i.e. a temperature of
+  exactly 0.0. Its key is built from the model, the temperature, the base url,
+  the stop words and the full prompt. Generations which really go to the
+  Ollama server wait for a free slot of their host first."""
+
+  def _cache_key(self, prompt, stop):
+    return json.dumps([self.model, self.temperature, self.base_url, stop, prompt])
+
+  def _use_cache(self):
+    return self.temperature == 0.0 and get_flag("LLM_CACHE", True)
+
+  def _generate(self, prompts, stop=None, run_manager=None, **kwargs):
+    # Ollama is a BaseLLM which only implements _generate, every call of the
+    # agents and chains ends up here.
+    cache = get_llm_cache() if self._use_cache() else None
+    generations = []
+    for prompt in prompts:
+      cached = cache.get("ollama", self._cache_key(prompt, stop)) if cache is not None else None
+      if cached is not None:
+        if run_manager:
+          run_manager.on_llm_new_token(cached)
+        generations.append([Generation(text=cached)])
+        continue
+      with ollama_requests.slot(self.base_url):
+        result = super()._generate([prompt], stop=stop, run_manager=run_manager, **kwargs)
+      if cache is not None:
+        cache.put("ollama", self._cache_key(prompt, stop), result.generations[0][0].text)
+      generations.append(result.generations[0])
+    return LLMResult(generations=generations)
+
+
+class TokenUsageHandler(BaseCallbackHandler):
+  """LangChain callback which records the duration and the token counts of
+  every LLM call of an agent."""
+
+  def __init__(self, trace, agent):
+    self.trace = trace
+    self.agent = agent
+    self._started = {}
+
+  def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+    self._started[run_id] = time.time()
+
+  def on_llm_end(self, response, run_id=None, **kwargs):
+    started = self._started.pop(run_id, time.time())
+    prompt_tokens = completion_tokens = 0
+    for generations in response.generations:
+      for generation in generations:
+        info = generation.generation_info or {}
+        prompt_tokens += info.get("prompt_eval_count") or 0
+        completion_tokens += info.get("eval_count") or 0
+    self.trace.record("llm", self.agent, time.time() - started,
+                      prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+  def on_llm_error(self, error, run_id=None, **kwargs):
+    self._started.pop(run_id, None)
+
+
+class TokenStreamHandler(BaseCallbackHandler):
+  """LangChain callback which passes the tokens of an agent to a TokenStream
+  while Ollama generates them."""
+
+  def __init__(self, stream, agent):
+    self.stream = stream
+    self.agent = agent
+
+  def on_llm_start(self, serialized, prompts, **kwargs):
+    self.stream.start(self.agent)
+
+  def on_llm_new_token(self, token, **kwargs):
+    self.stream.append(self.agent, token)
+
+  def on_llm_end(self, response, **kwargs):
+    self.stream.end(self.agent)
+
+  def on_llm_error(self, error, **kwargs):
+    self.stream.end(self.agent)
@@ -0,0 +1,124 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from tools.concurrency import crew_runs, ollama_requests
+from tools.http_client import request, request_json
+from tools.model_catalog import get_model_catalog
+from tools.settings import get_setting
+
+
+class OllamaPool():
+  """A pool of Ollama servers.
+
+  Requests for a model are routed to the least loaded host which has the model
+  already loaded (/api/ps), so switching between the agents does not force a
+  single box to swap models in and out of its VRAM all the time. Models can be
+  warmed up before a crew starts so the first call does not pay the load time."""
+
+  def __init__(self, hosts, keep_alive="30m", ps_ttl=10):
+    self.hosts = [host.rstrip("/") for host in hosts]
+    self.keep_alive = keep_alive
+    self.ps_ttl = ps_ttl
+    self._resident = {}
+    self._warming = {}
+    self._lock = threading.Lock()
+    self._executor = ThreadPoolExecutor(max_workers=max(2, len(self.hosts) * 2))
+
+  def model_names(self):
+    """All models of all hosts, the models of the first host come first."""
+    names = []
+    for host in self.hosts:
+      for name in get_model_catalog(f"{host}/api/tags").names():
+        if name not in names:
+          names.append(name)
+    return names
+
+  def catalog_error(self):
+    errors = [get_model_catalog(f"{host}/api/tags").error for host in self.hosts]
+    return next((error for error in errors if error), None)
+
+  def resident_models(self, host):
+    """The models which are loaded on the host right now, cached for ps_ttl seconds."""
+    with self._lock:
+      fetched_at, models = self._resident.get(host, (0.0, None))
+    if models is None or time.monotonic() - fetched_at > self.ps_ttl:
+      try:
+        data = request_json("GET", f"{host}/api/ps", timeout=(2, 5))
+        models = {model.get("name") or model.get("model") for model in data.get("models", [])}
+      except requests.RequestException:
+        models = models or set()
+      with self._lock:
+        self._resident[host] = (time.monotonic(), models)
+    return models
+
+  def load(self, host):
+    """The generations which run or wait on the host plus the crews which run
+    against it. A crew counts although it may be between two generations,
+    e.g. while its tools search the web."""
+    return ollama_requests.load(host) + crew_runs.in_flight(host)
+
+  def pick(self, model):
+    """Return the host for the model: a host which has the model loaded wins,
+    between equal hosts the least loaded one wins."""
+    candidates = [host for host in self.hosts if model in get_model_catalog(f"{host}/api/tags").names()]
+    candidates = candidates or self.hosts
+    return min(candidates, key=lambda host: (
+        model not in self.resident_models(host),
+        self.load(host),
+        self.hosts.index(host)))
+
+  def _load(self, host, model):
+    try:
+      # A generate request without a prompt only loads the model.
+      # Loading a big model can take minutes, so the read timeout is long.
+      response = request("POST", f"{host}/api/generate", json={"model": model, "keep_alive": self.keep_alive}, timeout=(5, 600))
+      # A model which is not on the host (404) or a failed load is not resident.
+      response.raise_for_status()
+      with self._lock:
+        fetched_at, models = self._resident.get(host, (0.0, set()))
+        self._resident[host] = (fetched_at, (models or set()) | {model})
+    finally:
+      with self._lock:
+        self._warming.pop((host, model), None)
+
+  def warm_up(self, host, model):
+    """Load the model on the host in the background. Returns a future, a model
+    which is already warming up is not requested twice."""
+    with self._lock:
+      future = self._warming.get((host, model))
+      if future is None:
+        future = self._executor.submit(self._load, host, model)
+        self._warming[(host, model)] = future
+      return future
+
+  def warm_up_all(self, targets, timeout=None):
+    """Warm up (host, model) pairs at the same time and wait for them."""
+    for future in [self.warm_up(host, model) for host, model in set(targets)]:
+      try:
+        future.result(timeout=timeout)
+      except Exception:
+        # A model which can not be warmed up is simply loaded on first use.
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ollama_pool(default_host):
+  """Return the process wide pool. The hosts are read from OLLAMA_HOSTS, a list
+  or a comma separated string, and default to the given host."""
+  global _pool
+  with _pool_lock:
+    if _pool is None:
+      hosts = get_setting("OLLAMA_HOSTS") or [default_host]
+      if isinstance(hosts, str):
+        hosts = [host.strip() for host in hosts.split(",") if host.strip()]
+      _pool = OllamaPool(
+          hosts,
+          keep_alive=get_setting("OLLAMA_KEEP_ALIVE", "30m"),
+          ps_ttl=float(get_setting("OLLAMA_PS_TTL", 10)))
+    return _pool
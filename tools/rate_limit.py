@@ -0,0 +1,115 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from tools.settings import get_setting
+
+# Requests per second, burst and maximum concurrency of the providers. Every
+# value can be changed with RATE_LIMIT_<PROVIDER>_RPS, _BURST and _CONCURRENCY.
+PROVIDER_DEFAULTS = {
+    "serper": (5.0, 10, 8),
+    "browserless": (2.0, 4, 4),
+}
+
+
+class AdaptiveLimiter():
+  """Token bucket plus an adaptive concurrency limit for one API provider.
+
+  The bucket allows rate requests per second with bursts of up to burst
+  requests. How many requests may run at the same time follows AIMD: every
+  success raises the limit a little, a 429 answer halves it and pauses the
+  provider for the Retry-After time. One limiter is shared by all crews of
+  the process, so they do not throttle each other's quota."""
+
+  def __init__(self, name, rate, burst, max_concurrency, min_concurrency=1):
+    self.name = name
+    self.rate = rate
+    self.burst = burst
+    self.max_concurrency = max_concurrency
+    self.min_concurrency = min_concurrency
+    self.concurrency = float(max_concurrency)
+    self.throttled = 0
+    self._tokens = float(burst)
+    self._refilled = time.monotonic()
+    self._paused_until = 0.0
+    self._in_flight = 0
+    self._condition = threading.Condition()
+
+  def _refill(self, now):
+    self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+    self._refilled = now
+
+  def _wait_time(self, now):
+    """Seconds until the next request may start, 0 if it may start now."""
+    if now < self._paused_until:
+      return self._paused_until - now
+    if self._in_flight >= int(self.concurrency):
+      # Woken up by the end of another request.
+      return None
+    if self._tokens < 1.0:
+      return (1.0 - self._tokens) / self.rate
+    return 0.0
+
+  @contextmanager
+  def slot(self):
+    """Wait for a token and a free concurrency slot."""
+    with self._condition:
+      while True:
+        now = time.monotonic()
+        self._refill(now)
+        wait = self._wait_time(now)
+        if wait == 0.0:
+          break
+        self._condition.wait(wait)
+      self._tokens -= 1.0
+      self._in_flight += 1
+    try:
+      yield
+    finally:
+      with self._condition:
+        self._in_flight -= 1
+        self._condition.notify_all()
+
+  def on_success(self):
+    # Additive increase, about one more slot for every `concurrency` successes.
+    with self._condition:
+      self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(1.0, self.concurrency))
+      self._condition.notify_all()
+
+  def on_throttle(self, retry_after=None):
+    # Multiplicative decrease and a pause for everybody.
+    with self._condition:
+      self.throttled += 1
+      self.concurrency = max(self.min_concurrency, self.concurrency / 2.0)
+      self._tokens = 0.0
+      pause = retry_after if retry_after is not None else 1.0 / self.rate
+      self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+  def stats(self):
+    with self._condition:
+      return {"concurrency": round(self.concurrency, 2), "in_flight": self._in_flight, "throttled": self.throttled}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider):
+  """Return the process wide limiter of the provider."""
+  with _limiters_lock:
+    if provider not in _limiters:
+      rate, burst, concurrency = PROVIDER_DEFAULTS.get(provider, (5.0, 10, 4))
+      prefix = f"RATE_LIMIT_{provider.upper()}"
+      _limiters[provider] = AdaptiveLimiter(
+          provider,
+          rate=float(get_setting(f"{prefix}_RPS", rate)),
+          burst=int(get_setting(f"{prefix}_BURST", burst)),
+          max_concurrency=int(get_setting(f"{prefix}_CONCURRENCY", concurrency)))
+    return _limiters[provider]
+
+
+def rate_limiter_stats():
+  """provider -> stats of every limiter which was used in this process."""
+  with _limiters_lock:
+    limiters = dict(_limiters)
+  return {provider: limiter.stats() for provider, limiter in sorted(limiters.items())}
@@ -0,0 +1,161 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from tools.http_client import request_json
+from tools.settings import get_setting
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when which who why will with".split())
+
+
+def tokenize(text):
+  return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index():
+  """Okapi BM25 index over the chunks of scraped pages.
+
+  The pages stay in the index for later calls, so a page which was scraped
+  before is not chunked and indexed again as long as its version, e.g. a
+  hash of its text, is the same. If more than max_pages pages are indexed
+  the least recently used page is dropped."""
+
+  def __init__(self, max_pages=50, k1=1.5, b=0.75):
+    self.max_pages = max_pages
+    self.k1 = k1
+    self.b = b
+    self._pages = OrderedDict()
+    self._versions = {}
+    self._df = Counter()
+    self._chunk_count = 0
+    self._total_length = 0
+    self._lock = threading.Lock()
+
+  def has_page(self, url, version=None):
+    """True if the page is indexed, with a version only if it is indexed in
+    this version."""
+    with self._lock:
+      return url in self._pages and (version is None or self._versions.get(url) == version)
+
+  def add_page(self, url, chunks, version=None):
+    entries = []
+    for chunk in chunks:
+      terms = Counter(tokenize(chunk))
+      entries.append((chunk, terms, sum(terms.values())))
+    with self._lock:
+      if url in self._pages:
+        self._remove(url)
+      self._pages[url] = entries
+      self._versions[url] = version
+      for _, terms, length in entries:
+        self._df.update(terms.keys())
+        self._chunk_count += 1
+        self._total_length += length
+      while len(self._pages) > self.max_pages:
+        self._remove(next(iter(self._pages)))
+
+  def _remove(self, url):
+    self._versions.pop(url, None)
+    for _, terms, length in self._pages.pop(url):
+      self._df.subtract(terms.keys())
+      self._chunk_count -= 1
+      self._total_length -= length
+    self._df += Counter()  # drops the terms which are not used anymore
+
+  def chunks(self, url):
+    with self._lock:
+      self._pages.move_to_end(url)
+      return [chunk for chunk, _, _ in self._pages[url]]
+
+  def search(self, url, query, top_k=3):
+    """Return the top_k chunks of the page which fit the query best. The chunks
+    are returned in the order of the page. Without a query or without any
+    matching chunk the first top_k chunks are returned."""
+    query_terms = tokenize(query or "")
+    with self._lock:
+      self._pages.move_to_end(url)
+      entries = self._pages[url]
+      if not query_terms:
+        return [chunk for chunk, _, _ in entries[:top_k]]
+      average_length = self._total_length / max(1, self._chunk_count)
+      scores = []
+      for position, (_, terms, length) in enumerate(entries):
+        score = 0.0
+        for term in query_terms:
+          frequency = terms.get(term, 0)
+          if not frequency:
+            continue
+          df = self._df[term]
+          idf = math.log(1 + (self._chunk_count - df + 0.5) / (df + 0.5))
+          score += idf * frequency * (self.k1 + 1) / (
+              frequency + self.k1 * (1 - self.b + self.b * length / max(1.0, average_length)))
+        if score > 0:
+          scores.append((score, position))
+      if not scores:
+        # Nothing on the page matches, so the start of the page is used.
+        return [chunk for chunk, _, _ in entries[:top_k]]
+    best = sorted(position for _, position in sorted(scores, key=lambda item: (-item[0], item[1]))[:top_k])
+    return [entries[position][0] for position in best]
+
+
+class OllamaEmbeddingIndex(BM25Index):
+  """Ranks the chunks by the cosine similarity of local Ollama embeddings
+  instead of BM25. The chunk embeddings are calculated once per page."""
+
+  def __init__(self, model, base_url, max_pages=50):
+    super().__init__(max_pages=max_pages)
+    self.model = model
+    self.base_url = base_url
+    self._embeddings = {}
+
+  def _embed(self, text):
+    data = request_json("POST", f"{self.base_url}/api/embeddings", json={"model": self.model, "prompt": text})
+    return data.get("embedding") or []
+
+  @staticmethod
+  def _cosine(a, b):
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return sum(x * y for x, y in zip(a, b)) / norm if norm else 0.0
+
+  def add_page(self, url, chunks, version=None):
+    embeddings = [self._embed(chunk) for chunk in chunks]
+    super().add_page(url, chunks, version)
+    with self._lock:
+      self._embeddings[url] = embeddings
+      for known in list(self._embeddings):
+        if known not in self._pages:
+          del self._embeddings[known]
+
+  def search(self, url, query, top_k=3):
+    if not query:
+      return super().search(url, query, top_k)
+    query_embedding = self._embed(query)
+    with self._lock:
+      self._pages.move_to_end(url)
+      entries = self._pages[url]
+      embeddings = self._embeddings.get(url, [])
+    scores = [(self._cosine(query_embedding, embedding), position) for position, embedding in enumerate(embeddings)]
+    best = sorted(position for _, position in sorted(scores, key=lambda item: (-item[0], item[1]))[:top_k])
+    return [entries[position][0] for position in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_relevance_index():
+  """Return the process wide index. With RELEVANCE_EMBED_MODEL set the chunks
+  are ranked with Ollama embeddings, otherwise with BM25."""
+  global _index
+  with _index_lock:
+    if _index is None:
+      max_pages = int(get_setting("RELEVANCE_MAX_PAGES", 50))
+      model = get_setting("RELEVANCE_EMBED_MODEL")
+      if model:
+        _index = OllamaEmbeddingIndex(
+            model, get_setting("RELEVANCE_EMBED_BASE_URL", "http://localhost:11434"), max_pages=max_pages)
+      else:
+        _index = BM25Index(max_pages=max_pages)
+    return _index
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from tools.settings import get_setting
+
+
+def normalize_query(query):
+  """Make near identical queries equal: case, unicode forms, white space and
+  quotes or punctuation around the query do not matter."""
+  query = unicodedata.normalize("NFKC", str(query)).lower()
+  query = re.sub(r"\s+", " ", query)
+  return query.strip(" \"'`.,;:!?")
+
+
+class ResultCache():
+  """A persistent cache on disk backed by SQLite.
+
+  Entries are stored per source (e.g. "serper" or "duckduckgo") under a hash
+  of the normalized query. Pass normalize=None if the exact text matters, as
+  for LLM prompts. Every source can have its own time to live in
+  seconds, None means the entries never expire. If there are more than
+  max_entries entries the least recently used ones are evicted."""
+
+  def __init__(self, path, max_entries=5000, ttls=None, default_ttl=None, normalize=normalize_query):
+    self.path = path
+    self.normalize = normalize
+    self.max_entries = max_entries
+    self.ttls = ttls or {}
+    self.default_ttl = default_ttl
+    self.hits = {}
+    self.misses = {}
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._db.execute(
+        "CREATE TABLE IF NOT EXISTS cache ("
+        " key TEXT PRIMARY KEY, source TEXT NOT NULL, value TEXT NOT NULL,"
+        " created REAL NOT NULL, last_used REAL NOT NULL)")
+    self._db.execute("CREATE INDEX IF NOT EXISTS cache_last_used ON cache (last_used)")
+    self._db.commit()
+
+  def key(self, source, query):
+    if self.normalize is not None:
+      query = self.normalize(query)
+    return hashlib.sha256(f"{source}\0{query}".encode("utf-8")).hexdigest()
+
+  def get(self, source, query):
+    """Return the cached value or None if there is no fresh entry."""
+    key = self.key(source, query)
+    ttl = self.ttls.get(source, self.default_ttl)
+    now = time.time()
+    with self._lock:
+      row = self._db.execute("SELECT value, created FROM cache WHERE key = ?", (key,)).fetchone()
+      if row is not None and ttl is not None and now - row[1] > ttl:
+        self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+        self._db.commit()
+        row = None
+      if row is None:
+        self.misses[source] = self.misses.get(source, 0) + 1
+        return None
+      self._db.execute("UPDATE cache SET last_used = ? WHERE key = ?", (now, key))
+      self._db.commit()
+      self.hits[source] = self.hits.get(source, 0) + 1
+      return row[0]
+
+  def put(self, source, query, value):
+    now = time.time()
+    with self._lock:
+      self._db.execute(
+          "INSERT OR REPLACE INTO cache (key, source, value, created, last_used) VALUES (?, ?, ?, ?, ?)",
+          (self.key(source, query), source, value, now, now))
+      # Evict the least recently used entries if the cache is too big.
+      self._db.execute(
+          "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+          (self.max_entries,))
+      self._db.commit()
+
+  def stats(self):
+    """Hits, misses and stored entries per source."""
+    with self._lock:
+      entries = dict(self._db.execute("SELECT source, COUNT(*) FROM cache GROUP BY source").fetchall())
+    sources = set(entries) | set(self.hits) | set(self.misses)
+    return {
+        source: {
+            "hits": self.hits.get(source, 0),
+            "misses": self.misses.get(source, 0),
+            "entries": entries.get(source, 0),
+        } for source in sorted(sources)
+    }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_search_cache():
+  """Return the process wide cache for the search tools."""
+  with _caches_lock:
+    if "search" not in _caches:
+      _caches["search"] = ResultCache(
+          get_setting("SEARCH_CACHE_PATH", ".cache/search_cache.sqlite"),
+          max_entries=int(get_setting("SEARCH_CACHE_MAX_ENTRIES", 5000)),
+          ttls={
+              "serper": float(get_setting("SEARCH_CACHE_TTL_SERPER", 86400)),
+              "duckduckgo": float(get_setting("SEARCH_CACHE_TTL_DUCKDUCKGO", 86400)),
+              "metasearch": float(get_setting("SEARCH_CACHE_TTL_METASEARCH", 86400)),
+          })
+    return _caches["search"]
+
+
+def get_llm_cache():
+  """Return the process wide cache for LLM responses. Prompts are not
+  normalized, the entries do not expire unless LLM_CACHE_TTL is set."""
+  with _caches_lock:
+    if "llm" not in _caches:
+      ttl = get_setting("LLM_CACHE_TTL")
+      _caches["llm"] = ResultCache(
+          get_setting("LLM_CACHE_PATH", ".cache/llm_cache.sqlite"),
+          max_entries=int(get_setting("LLM_CACHE_MAX_ENTRIES", 2000)),
+          default_ttl=float(ttl) if ttl else None,
+          normalize=None)
+    return _caches["llm"]
+
+
+def get_page_cache():
+  """Return the process wide cache for the extracted text of websites. The
+  entries are revalidated with the ETag and Last-Modified of the page."""
+  with _caches_lock:
+    if "page" not in _caches:
+      _caches["page"] = ResultCache(
+          get_setting("PAGE_CACHE_PATH", ".cache/page_cache.sqlite"),
+          max_entries=int(get_setting("PAGE_CACHE_MAX_ENTRIES", 500)),
+          default_ttl=float(get_setting("PAGE_CACHE_TTL", 604800)),
+          normalize=None)
+    return _caches["page"]
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tools.settings import get_setting
+
+# The settings of an agent which change what it writes. The host it runs on
+# does not, so a run can be resumed on another Ollama server.
+AGENT_FIELDS = ("model", "temperature", "max_iterations", "role", "goal", "backstory")
+
+
+def task_keys(config, dependencies):
+  """One key per task, a hash of its agent, its description, the compaction
+  budget and the keys of the tasks it depends on. A change of a task changes
+  the keys of all tasks after it, their checkpoints are not used anymore."""
+  keys = {}
+  remaining = dict(dependencies)
+  while remaining:
+    for role, depends_on in list(remaining.items()):
+      if any(dependency not in keys for dependency in depends_on):
+        continue
+      agent = config["agents"][role]
+      data = {
+          "agent": {field: agent.get(field) for field in AGENT_FIELDS},
+          "task": config["tasks"][role],
+          "compact_tokens": config.get("compact_tokens") or 0,
+          "inputs": [keys[dependency] for dependency in depends_on],
+      }
+      keys[role] = hashlib.sha256(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+      del remaining[role]
+  return keys
+
+
+class RunStore():
+  """Crew runs and the results of their tasks on disk, backed by SQLite.
+
+  Every finished task is saved as a checkpoint under its task key together
+  with the results it got as input. A new run with the same key takes the
+  result from the checkpoint instead of running the task again.
+
+  Only finished runs are dropped, the oldest first, when there are more than
+  max_runs of them, and only when they were finished more than min_age
+  seconds ago. So a batch of hundreds of topics keeps the checkpoints of its
+  first topics. A run which did not save anything for stale_after seconds
+  was cut off by the end of its process, it is marked as interrupted."""
+
+  def __init__(self, path, max_runs=200, min_age=86400, stale_after=21600):
+    self.path = path
+    self.max_runs = max_runs
+    self.min_age = min_age
+    self.stale_after = stale_after
+    self._lock = threading.Lock()
+    directory = os.path.dirname(path)
+    if directory:
+      os.makedirs(directory, exist_ok=True)
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._db.execute(
+        "CREATE TABLE IF NOT EXISTS runs ("
+        " run_id TEXT PRIMARY KEY, description TEXT NOT NULL, config TEXT NOT NULL,"
+        " status TEXT NOT NULL, result TEXT, created REAL NOT NULL, updated REAL NOT NULL)")
+    self._db.execute(
+        "CREATE TABLE IF NOT EXISTS checkpoints ("
+        " key TEXT PRIMARY KEY, task TEXT NOT NULL, inputs TEXT NOT NULL,"
+        " output TEXT NOT NULL, created REAL NOT NULL)")
+    # A checkpoint can be used by many runs.
+    self._db.execute(
+        "CREATE TABLE IF NOT EXISTS run_tasks ("
+        " run_id TEXT NOT NULL, task TEXT NOT NULL, key TEXT NOT NULL, finished REAL NOT NULL,"
+        " PRIMARY KEY (run_id, task))")
+    self._mark_interrupted(time.time())
+    self._db.commit()
+
+  def _mark_interrupted(self, now):
+    self._db.execute(
+        "UPDATE runs SET status = 'interrupted' WHERE status = 'running' AND updated < ?",
+        (now - self.stale_after,))
+
+  def start_run(self, run_id, config, description=""):
+    """Start a run or resume it under the same run_id."""
+    now = time.time()
+    with self._lock:
+      self._db.execute(
+          "INSERT INTO runs (run_id, description, config, status, result, created, updated)"
+          " VALUES (?, ?, ?, 'running', NULL, ?, ?)"
+          " ON CONFLICT (run_id) DO UPDATE SET description = excluded.description, config = excluded.config,"
+          " status = 'running', result = NULL, updated = excluded.updated",
+          (run_id, description, json.dumps(config), now, now))
+      self._mark_interrupted(now)
+      # Only the latest finished runs are kept and the checkpoints none of the
+      # runs uses anymore are dropped.
+      self._db.execute(
+          "DELETE FROM runs WHERE run_id IN (SELECT run_id FROM runs WHERE status != 'running' AND run_id != ?"
+          " ORDER BY updated DESC LIMIT -1 OFFSET ?) AND updated < ?",
+          (run_id, self.max_runs, now - self.min_age))
+      self._db.execute("DELETE FROM run_tasks WHERE run_id NOT IN (SELECT run_id FROM runs)")
+      self._db.execute("DELETE FROM checkpoints WHERE key NOT IN (SELECT key FROM run_tasks)")
+      self._db.commit()
+
+  def finish_run(self, run_id, status, result=None):
+    with self._lock:
+      self._db.execute(
+          "UPDATE runs SET status = ?, result = ?, updated = ? WHERE run_id = ?",
+          (status, result, time.time(), run_id))
+      self._db.commit()
+
+  def checkpoint(self, key):
+    """The saved result of the task with this key or None."""
+    with self._lock:
+      row = self._db.execute("SELECT output FROM checkpoints WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+  def save_checkpoint(self, run_id, task, key, inputs, output):
+    """Save the result of a finished task and the results it got as input."""
+    with self._lock:
+      self._db.execute(
+          "INSERT OR REPLACE INTO checkpoints (key, task, inputs, output, created) VALUES (?, ?, ?, ?, ?)",
+          (key, task, json.dumps(inputs), output, time.time()))
+      self._link(run_id, task, key)
+      self._db.commit()
+
+  def use_checkpoint(self, run_id, task, key):
+    """Record that the run took the result of the task from a checkpoint."""
+    with self._lock:
+      self._link(run_id, task, key)
+      self._db.commit()
+
+  def _link(self, run_id, task, key):
+    now = time.time()
+    self._db.execute(
+        "INSERT OR REPLACE INTO run_tasks (run_id, task, key, finished) VALUES (?, ?, ?, ?)",
+        (run_id, task, key, now))
+    # A run which saves its tasks is still alive.
+    self._db.execute("UPDATE runs SET updated = ? WHERE run_id = ?", (now, run_id))
+
+  def runs(self, limit=50):
+    """The latest runs, newest first, without their config and result."""
+    with self._lock:
+      rows = self._db.execute(
+          "SELECT run_id, description, status, created, updated FROM runs ORDER BY updated DESC LIMIT ?",
+          (limit,)).fetchall()
+    return [dict(zip(("run_id", "description", "status", "created", "updated"), row)) for row in rows]
+
+  def load_run(self, run_id):
+    """A run with its config, its result and the results of the tasks which
+    were finished in it. None if the run is unknown."""
+    with self._lock:
+      row = self._db.execute(
+          "SELECT description, config, status, result, created, updated FROM runs WHERE run_id = ?",
+          (run_id,)).fetchone()
+      if row is None:
+        return None
+      tasks = dict(self._db.execute(
+          "SELECT run_tasks.task, checkpoints.output FROM run_tasks JOIN checkpoints ON run_tasks.key = checkpoints.key"
+          " WHERE run_tasks.run_id = ? ORDER BY run_tasks.finished", (run_id,)).fetchall())
+    description, config, status, result, created, updated = row
+    return {"run_id": run_id, "description": description, "config": json.loads(config), "status": status,
+            "result": result, "created": created, "updated": updated, "tasks": tasks}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_store():
+  """Return the process wide run store."""
+  global _store
+  with _store_lock:
+    if _store is None:
+      _store = RunStore(
+          get_setting("RUN_STORE_PATH", ".cache/runs.sqlite"),
+          max_runs=int(get_setting("RUN_STORE_MAX_RUNS", 200)),
+          min_age=float(get_setting("RUN_STORE_MIN_AGE", 86400)),
+          stale_after=float(get_setting("RUN_STORE_STALE_AFTER", 21600)))
+    return _store
@@ -1,37 +1,198 @@
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-import requests
-import streamlit as st
+from crewai_tools import tool as crewai_tool
 from langchain.tools import tool
 
+from tools.http_client import RateLimited, request_json
+from tools.instrumentation import timed_tool
+from tools.result_cache import get_search_cache
+from tools.settings import get_setting
+
+# Query parameters which only track the visitor, they do not change the page.
+# Only the utm_ parameters are matched by their prefix, the others exactly,
+# "ref" must not remove "reference" or "refid".
+TRACKING_PREFIXES = ("utm_",)
+TRACKING_PARAMETERS = frozenset(("fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src"))
+
+
+def is_tracking_parameter(key):
+  key = key.lower()
+  return key in TRACKING_PARAMETERS or key.startswith(TRACKING_PREFIXES)
+
+
+def format_results(results):
+  """The Title/Link/Snippet blocks the agents read and the step log shows."""
+  string = []
+  for result in results:
+    try:
+      string.append('\n'.join([
+          f"Title: {result['title']}", f"Link: {result['link']}",
+          f"Snippet: {result['snippet']}", "\n-----------------"
+      ]))
+    except KeyError:
+      next
+  return '\n'.join(string)
+
+
+def serper_results(query):
+  """The organic results of Serper as a list of dicts, None if the answer has
+  no organic results, e.g. because of a wrong api key."""
+  url = get_setting("SERPER_URL", "https://google.serper.dev/search")
+  payload = json.dumps({"q": query})
+  headers = {
+      'X-API-KEY': get_setting('SERPER_API_KEY'),
+      'content-type': 'application/json'
+  }
+  # The response is parsed only once. Serper has a quota, the requests are
+  # spaced out by its rate limiter.
+  data = request_json("POST", url, provider="serper", headers=headers, data=payload)
+  return data.get('organic')
+
 
 class SearchTools():
 
   @tool("Search the internet")
+  @timed_tool("search_internet")
   def search_internet(query):
     """Useful to search the internet
     about a a given topic and return relevant results"""
     top_result_to_return = 4
-    url = "https://google.serper.dev/search"
-    payload = json.dumps({"q": query})
-    headers = {
-        'X-API-KEY': st.secrets['SERPER_API_KEY'],
-        'content-type': 'application/json'
-    }
-    response = requests.request("POST", url, headers=headers, data=payload)
+    # Agents often repeat their queries, the cache saves the time and the quota.
+    cache = get_search_cache()
+    cached = cache.get("serper", query)
+    if cached is not None:
+      return cached
+    try:
+      results = serper_results(query)
+    except RateLimited:
+      return "The search is busy right now, please wait a moment before you search again."
     # check if there is an organic key
-    if 'organic' not in response.json():
+    if results is None:
       return "Sorry, I couldn't find anything about that, there could be an error with you serper api key."
     else:
-      results = response.json()['organic']
-      string = []
-      for result in results[:top_result_to_return]:
-        try:
-          string.append('\n'.join([
-              f"Title: {result['title']}", f"Link: {result['link']}",
-              f"Snippet: {result['snippet']}", "\n-----------------"
-          ]))
-        except KeyError:
-          next
-
-      return '\n'.join(string)
+      result = format_results(results[:top_result_to_return])
+      cache.put("serper", query, result)
+      return result
+
+
+# DuckDuckGo does not need an api key. The search client is created once per
+# process, on first use.
+_search_tool = None
+_search_tool_lock = threading.Lock()
+
+
+def get_duckduckgo():
+  global _search_tool
+  with _search_tool_lock:
+    if _search_tool is None:
+      from langchain_community.tools import DuckDuckGoSearchRun
+      _search_tool = DuckDuckGoSearchRun()
+    return _search_tool
+
+
+# This is more or less a work around that hopefully will work for the dd_search.
+@crewai_tool('DuckDuckGoSearch')
+@timed_tool("dd_search")
+def dd_search(search_query: str):
+  """Search the web for information on a given topic"""
+  cache = get_search_cache()
+  cached = cache.get("duckduckgo", search_query)
+  if cached is not None:
+    return cached
+  result = get_duckduckgo().run(search_query)
+  cache.put("duckduckgo", search_query, result)
+  return result
+
+
+def duckduckgo_results(query, max_results=8):
+  """The results of DuckDuckGo as a list of dicts with title, link and snippet."""
+  return get_duckduckgo().api_wrapper.results(query, max_results)
+
+
+def canonical_url(url):
+  """Normalize a link so the same page found by two search engines is only
+  listed once: lower case host without www, no fragment, no tracking
+  parameters and no trailing slash."""
+  parts = urlsplit(url.strip())
+  host = parts.netloc.lower()
+  if host.startswith("www."):
+    host = host[4:]
+  query = urlencode(sorted(
+      (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+      if not is_tracking_parameter(key)))
+  return urlunsplit(("https" if parts.scheme in ("http", "https") else parts.scheme,
+                     host, parts.path.rstrip("/"), query, ""))
+
+
+def reciprocal_rank_fusion(result_lists, k=60):
+  """Merge ranked result lists. A result scores 1 / (k + rank) in every list
+  it appears in, so pages found by both engines move up. The first occurrence
+  of a page provides its title and snippet."""
+  scores = {}
+  merged = {}
+  for results in result_lists:
+    for rank, result in enumerate(results, start=1):
+      link = result.get("link")
+      if not link:
+        continue
+      key = canonical_url(link)
+      scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+      merged.setdefault(key, result)
+  return [merged[key] for key in sorted(scores, key=lambda key: -scores[key])]
+
+
+# Serper and DuckDuckGo are asked at the same time.
+_search_executor = ThreadPoolExecutor(max_workers=8)
+
+
+def search_backends():
+  """name -> (function, deadline in seconds) of the engines of the meta search."""
+  backends = {}
+  if get_setting("SERPER_API_KEY"):
+    backends["serper"] = (serper_results, float(get_setting("SEARCH_DEADLINE_SERPER", 8)))
+  backends["duckduckgo"] = (duckduckgo_results, float(get_setting("SEARCH_DEADLINE_DUCKDUCKGO", 8)))
+  return backends
+
+
+def meta_search(query, top_k=None):
+  """Search all backends concurrently and return the merged, deduplicated
+  results. A backend which misses its deadline or fails is left out. Returns
+  the formatted results and whether all backends answered."""
+  top_k = top_k or int(get_setting("SEARCH_TOP_K", 6))
+  started = time.monotonic()
+  futures = {name: (_search_executor.submit(function, query), deadline)
+             for name, (function, deadline) in search_backends().items()}
+  result_lists = []
+  complete = True
+  for name, (future, deadline) in futures.items():
+    try:
+      results = future.result(timeout=max(0.0, started + deadline - time.monotonic()))
+    except Exception:
+      # Timeouts and errors of one engine do not stop the other one.
+      future.cancel()
+      complete = False
+      continue
+    result_lists.append(results or [])
+  return format_results(reciprocal_rank_fusion(result_lists)[:top_k]), complete
+
+
+@tool("Search the web")
+@timed_tool("meta_search")
+def web_search(query):
+  """Useful to search the internet about a given topic. Searches several
+  search engines at once and returns the best results of all of them."""
+  cache = get_search_cache()
+  cached = cache.get("metasearch", query)
+  if cached is not None:
+    return cached
+  result, complete = meta_search(query)
+  if not result:
+    return "Sorry, I couldn't find anything about that, try another search query."
+  # Results without one of the engines are not kept, the next call may get both.
+  if complete:
+    cache.put("metasearch", query, result)
+  return result
@@ -0,0 +1,23 @@
+import os
+
+import streamlit as st
+
+
+def get_setting(name, default=None):
+  """Read a setting from the environment first and then from the streamlit
+  secrets file. The default is returned if neither of them knows the name."""
+  if name in os.environ:
+    return os.environ[name]
+  try:
+    return st.secrets.get(name, default)
+  except FileNotFoundError:
+    # There is no secrets.toml at all, e.g. in a plain python process.
+    return default
+
+
+def get_flag(name, default=False):
+  """Read an on/off setting, e.g. true, false, 1 or 0."""
+  value = get_setting(name, default)
+  if isinstance(value, str):
+    return value.strip().lower() in ("1", "true", "yes", "on")
+  return bool(value)
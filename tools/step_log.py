@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import deque
+
+
+def _line(line):
+  # The Title/Link/Snippet lines of the search tools are shown in bold.
+  for prefix in ("Title: ", "Link: ", "Snippet: "):
+    if line.startswith(prefix):
+      return f"**{prefix.strip()}** {line[len(prefix):]}"
+  return line
+
+
+def format_step(step_output):
+  """Turn the output of one agent step into a title and one markdown text, so
+  the page needs only one element per step."""
+  parts = []
+  tools = []
+  for step in step_output if isinstance(step_output, (list, tuple)) else [step_output]:
+    if isinstance(step, tuple) and len(step) == 2:
+      action, observation = step
+      if isinstance(action, dict) and "tool" in action and "tool_input" in action and "log" in action:
+        tools.append(f"{action['tool']} ({str(action['tool_input'])[:60]})")
+        parts.append("# Action")
+        parts.append(f"**Tool:** {action['tool']}")
+        parts.append(f"**Tool Input** {action['tool_input']}")
+        parts.append(f"**Log:** {action['log']}")
+        parts.append(f"**Action:** {action.get('Action', action['tool'])}")
+        parts.append(f"**Action Input:** ```json\n{action['tool_input']}\n```")
+      else:
+        tool = getattr(action, "tool", None)
+        if tool:
+          tools.append(f"{tool} ({str(getattr(action, 'tool_input', ''))[:60]})")
+        parts.append(f"**Action:** {action}")
+      parts.append("**Observation**")
+      if isinstance(observation, str):
+        parts.extend(_line(line) for line in observation.split("\n"))
+      else:
+        parts.append(str(observation))
+    else:
+      parts.append(str(step))
+  title = ", ".join(dict.fromkeys(tools)) if tools else "Answer"
+  return title, "\n\n".join(parts)
+
+
+class StepLog():
+  """The steps of a run, formatted once when they arrive.
+
+  Every step is appended to a log file which can be downloaded. Only the
+  latest max_live steps are kept in memory for the page, each cut to
+  max_chars characters, so a long run does not fill the memory of the server
+  or the browser."""
+
+  def __init__(self, path, max_live=30, max_chars=4000):
+    self.path = path
+    self.max_chars = max_chars
+    self.count = 0
+    self._live = deque(maxlen=max_live)
+    self._lock = threading.Lock()
+
+  def add(self, step_output):
+    title, text = format_step(step_output)
+    with self._lock:
+      self.count += 1
+      directory = os.path.dirname(self.path)
+      if directory:
+        os.makedirs(directory, exist_ok=True)
+      with open(self.path, "a", encoding="utf-8") as f:
+        f.write(f"## Step {self.count}: {title}\n\n{text}\n\n---\n\n")
+      if len(text) > self.max_chars:
+        text = text[:self.max_chars] + "\n\n*... the full step is in the step log.*"
+      self._live.append((self.count, title, text))
+
+  @property
+  def hidden(self):
+    """Number of earlier steps which are only in the log file."""
+    with self._lock:
+      return self.count - len(self._live)
+
+  def live(self):
+    """(number, title, markdown) of the steps which are still in memory."""
+    with self._lock:
+      return list(self._live)
+
+  def text(self):
+    """All steps as one markdown text."""
+    with self._lock:
+      if not os.path.exists(self.path):
+        return ""
+      with open(self.path, encoding="utf-8") as f:
+        return f.read()
+
+  def delete(self):
+    with self._lock:
+      if os.path.exists(self.path):
+        os.remove(self.path)
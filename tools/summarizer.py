@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from crewai import Agent, Task
+
+from tools.chunking import estimate_tokens, model_chunker
+from tools.ollama_llm import CachedOllama
+from tools.settings import get_flag, get_setting
+
+SUMMARY_TASK = 'Analyze and summarize the content bellow, make sure to include the most relevant information in the summary, return only the summary nothing else.\n\nCONTENT\n----------\n{content}'
+MERGE_TASK = 'Merge the partial summaries bellow into one summary, keep the most relevant information of every part and drop what is repeated, return only the summary nothing else.\n\nSUMMARIES\n----------\n{content}'
+
+
+class ChunkSummarizer():
+  """Map-reduce summarizer for long texts which are split into chunks.
+
+  The chunks are summarized at the same time by a bounded pool of workers.
+  Every worker thread builds its agent once from the same configuration and
+  reuses it for all chunks it gets. If reduce is switched on the partial
+  summaries are merged in groups of merge_fan_in until one summary is left."""
+
+  def __init__(self, llm=None, max_workers=4, reduce=False, merge_fan_in=4):
+    self.llm = llm
+    self.max_workers = max_workers
+    self.reduce = reduce
+    self.merge_fan_in = max(2, merge_fan_in)
+    self._local = threading.local()
+    # The pool lives as long as the summarizer, so the worker threads and
+    # their agents are reused by every page that is scraped.
+    self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+
+  def _agent(self):
+    # crewAI agents keep state while they execute a task, so they are not
+    # shared between threads. One agent per worker thread is enough.
+    if not hasattr(self._local, "agent"):
+      kwargs = {"llm": self.llm} if self.llm is not None else {}
+      self._local.agent = Agent(
+          role='Principal Researcher',
+          goal=
+          'Do amazing researches and summaries based on the content you are working with',
+          backstory=
+          "You're a Principal Researcher at a big company and you need to do a research about a given topic.",
+          allow_delegation=False,
+          **kwargs)
+    return self._local.agent
+
+  def _run(self, template, content):
+    task = Task(agent=self._agent(), description=template.format(content=content))
+    return task.execute()
+
+  def _map(self, template, texts):
+    # executor.map keeps the order of the texts.
+    return list(self._executor.map(lambda text: self._run(template, text), texts))
+
+  def summarize(self, chunks):
+    if not chunks:
+      return ""
+    summaries = self._map(SUMMARY_TASK, chunks)
+    while self.reduce and len(summaries) > 1:
+      groups = [
+          "\n\n".join(summaries[i:i + self.merge_fan_in])
+          for i in range(0, len(summaries), self.merge_fan_in)
+      ]
+      summaries = self._map(MERGE_TASK, groups)
+    return "\n\n".join(summaries)
+
+
+def summary_llm():
+  """The LLM for the scraper summaries. Without SUMMARY_MODEL the crewAI default
+  LLM is used."""
+  model = get_setting("SUMMARY_MODEL")
+  if not model:
+    return None
+  return CachedOllama(model=model, base_url=get_setting("SUMMARY_BASE_URL", "http://localhost:11434"))
+
+
+def summary_chunker():
+  """The Chunker for the content which is summarized. Its chunks fill the
+  context window of SUMMARY_MODEL, less the summary task and
+  SUMMARY_RESERVED_TOKENS for the agent prompt and the answer. Without
+  SUMMARY_MODEL the chunks have CHUNK_MAX_TOKENS tokens."""
+  reserved = estimate_tokens(SUMMARY_TASK) + int(get_setting("SUMMARY_RESERVED_TOKENS", 1024))
+  return model_chunker(get_setting("SUMMARY_MODEL"), get_setting("SUMMARY_BASE_URL", "http://localhost:11434"),
+                       reserved_tokens=reserved)
+
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+
+def get_summarizer():
+  """Return the process wide summarizer, configured from the settings."""
+  global _summarizer
+  with _summarizer_lock:
+    if _summarizer is None:
+      _summarizer = ChunkSummarizer(
+          llm=summary_llm(),
+          max_workers=int(get_setting("SUMMARY_WORKERS", 4)),
+          reduce=get_flag("SUMMARY_REDUCE", False),
+          merge_fan_in=int(get_setting("SUMMARY_MERGE_FAN_IN", 4)))
+    return _summarizer
@@ -0,0 +1,65 @@
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class TaskGraph():
+  """Runs functions which depend on the results of other functions.
+
+  Every node is added with the names of the nodes it depends on. A node starts
+  as soon as all of its dependencies are done, so nodes which do not depend on
+  each other run at the same time. The function of a node gets an ordered
+  dict with the results of its dependencies, in the order of depends_on."""
+
+  def __init__(self):
+    self._nodes = OrderedDict()
+
+  def add(self, name, function, depends_on=()):
+    if name in self._nodes:
+      raise ValueError(f"the task '{name}' is already in the graph")
+    self._nodes[name] = (function, tuple(depends_on))
+    return self
+
+  def dependencies(self, name):
+    return self._nodes[name][1]
+
+  def order(self):
+    """The names in an order in which every node comes after its
+    dependencies. Raises ValueError for unknown dependencies and cycles."""
+    for name, (_, depends_on) in self._nodes.items():
+      for dependency in depends_on:
+        if dependency not in self._nodes:
+          raise ValueError(f"the task '{name}' depends on the unknown task '{dependency}'")
+    ordered = []
+    remaining = OrderedDict(self._nodes)
+    while remaining:
+      ready = [name for name, (_, depends_on) in remaining.items() if all(d in ordered for d in depends_on)]
+      if not ready:
+        raise ValueError(f"the tasks {', '.join(remaining)} depend on each other")
+      for name in ready:
+        ordered.append(name)
+        del remaining[name]
+    return ordered
+
+  def run(self, max_workers=None):
+    """Run all nodes and return their results in the order in which they were
+    added. If a node fails, the nodes which did not start yet are skipped and
+    the exception is raised."""
+    self.order()
+    results = {}
+    pending = OrderedDict(self._nodes)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(self._nodes))) as executor:
+      while pending or running:
+        for name in [name for name, (_, depends_on) in pending.items() if all(d in results for d in depends_on)]:
+          function, depends_on = pending.pop(name)
+          inputs = OrderedDict((dependency, results[dependency]) for dependency in depends_on)
+          running[executor.submit(function, inputs)] = name
+        done, _ = wait(running, return_when=FIRST_COMPLETED)
+        for future in done:
+          name = running.pop(future)
+          try:
+            results[name] = future.result()
+          except Exception:
+            pending.clear()
+            raise
+    return OrderedDict((name, results[name]) for name in self._nodes)
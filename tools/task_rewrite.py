@@ -0,0 +1,140 @@
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+from tools.chunking import estimate_tokens
+from tools.result_cache import get_llm_cache
+from tools.settings import get_flag, get_setting
+
+# The role descriptions used to ask the LLM for a new task description.
+ROLES = {
+    "researcher": "to be a researcher who like to understand various topics",
+    "consultant": "an business angle investor who does analysis",
+    "autor": "to be an autor who likes to write articles",
+}
+
+
+@lru_cache(maxsize=64)
+def rewrite_template(role, example_task):
+  return "As an AI assistant please write a task description for an AI agent whos role is " + ROLES[role] + ". This is an example task description for an AI agent. The AI agent needs this task to understand what he has to do. \n Example task description:\n" + example_task + "\n Please rewrite this task description for the new topic which is described as follows: \n New topic: \n{task_description} \nImportant for the rewritten new task description is to keep the structure of the example task description provided."
+
+
+@lru_cache(maxsize=64)
+def rewrite_prompt(role, example_task):
+  # LangChain is only imported when the first task is rewritten.
+  from langchain.prompts import PromptTemplate
+  return PromptTemplate(template=rewrite_template(role, example_task), input_variables=["task_description"])
+
+
+def rewrite_task(llm, role, example_task, task_description):
+  """Rewrite one example task so that it fits the new task description."""
+  from langchain.chains import LLMChain
+  prompt = rewrite_prompt(role, example_task)
+  llm_chain = LLMChain(prompt=prompt, llm=llm)
+  # A CachedOllama llm waits for a free slot so the Ollama server is not
+  # oversubscribed.
+  return llm_chain.run({"task_description": task_description})
+
+
+def rewrite_tasks(llm, example_tasks, task_description):
+  """Rewrite all example tasks at the same time.
+
+  example_tasks maps a role from ROLES to its example task. The (role, text)
+  pairs are yielded in the order in which the LLM finishes them, so the
+  caller can show every result as soon as it is there."""
+  with ThreadPoolExecutor(max_workers=len(example_tasks)) as executor:
+    futures = {
+        executor.submit(rewrite_task, llm, role, example, task_description): role
+        for role, example in example_tasks.items()
+    }
+    for future in as_completed(futures):
+      yield futures[future], future.result()
+
+
+BATCH_REWRITE_TEMPLATE = "As an AI assistant please write task descriptions for several AI agents. Below is an example task description for every agent. Please rewrite every example task description for the new topic which is described as follows: \n New topic: \n{task_description} \nImportant for every rewritten task description is to keep the structure of its example task description.\n"
+BATCH_REWRITE_ANSWER = "\nAnswer only with a JSON object which has the keys {keys} and the rewritten task description of the agent as the value of its key, nothing else."
+
+
+def batch_rewrite_template(example_tasks):
+  """One prompt with the example tasks of all roles."""
+  parts = [BATCH_REWRITE_TEMPLATE]
+  for role, example in example_tasks.items():
+    # The examples are not part of the template syntax.
+    example = example.replace("{", "{{").replace("}", "}}")
+    parts.append(f"\nExample task description for the agent \"{role}\" whos role is {ROLES[role]}:\n{example}\n")
+  keys = ", ".join(f'"{role}"' for role in example_tasks)
+  parts.append(BATCH_REWRITE_ANSWER.format(keys=keys))
+  return "".join(parts)
+
+
+def parse_batch_rewrite(text, roles, min_chars=40):
+  """The task descriptions of the roles from the JSON answer of the LLM.
+  Roles which are missing or have no usable text are left out, an answer
+  which is no JSON object gives an empty dict."""
+  start, end = text.find("{"), text.rfind("}")
+  if start < 0 or end <= start:
+    return {}
+  try:
+    # The task descriptions have many lines, LLMs often write the line breaks
+    # into the strings as they are.
+    data = json.loads(text[start:end + 1], strict=False)
+  except ValueError:
+    return {}
+  if not isinstance(data, dict):
+    return {}
+  return {
+      role: data[role].strip() for role in roles
+      if isinstance(data.get(role), str) and len(data[role].strip()) >= min_chars
+  }
+
+
+def rewrite_cache_key(llm, example_tasks, task_description):
+  # The prompt with the examples is hashed, a changed example task or
+  # template gives new rewrites.
+  template = hashlib.sha256(batch_rewrite_template(example_tasks).encode("utf-8")).hexdigest()
+  return json.dumps([task_description.strip(), llm.model, llm.temperature, template])
+
+
+def batch_rewrite_num_ctx(example_tasks, task_description):
+  """The context the batch request needs: the prompt plus an answer about as
+  long as all examples together, rounded up to a multiple of 1024 tokens.
+  Ollama's default of 2048 tokens does not even hold the prompt."""
+  if get_setting("REWRITE_NUM_CTX"):
+    return int(get_setting("REWRITE_NUM_CTX"))
+  prompt = estimate_tokens(batch_rewrite_template(example_tasks)) + estimate_tokens(task_description)
+  answer = sum(estimate_tokens(example) for example in example_tasks.values())
+  return -(-(prompt + answer + 256) // 1024) * 1024
+
+
+def rewrite_tasks_batch(llm, example_tasks, task_description):
+  """Rewrite all example tasks with a single LLM call.
+
+  The LLM is asked for one JSON object with all task descriptions, so the
+  topic is evaluated once instead of once per task. Roles which are not in a
+  valid answer are rewritten one by one with rewrite_tasks. The results are
+  cached per description, model, temperature and examples. Yields (role,
+  text) pairs like rewrite_tasks."""
+  from langchain.chains import LLMChain
+  from langchain.prompts import PromptTemplate
+  cache = get_llm_cache() if get_flag("REWRITE_CACHE", True) else None
+  key = rewrite_cache_key(llm, example_tasks, task_description)
+  cached = cache.get("rewrite", key) if cache is not None else None
+  if cached is not None:
+    yield from json.loads(cached).items()
+    return
+
+  prompt = PromptTemplate(template=batch_rewrite_template(example_tasks), input_variables=["task_description"])
+  # Ollama only answers with valid JSON in its JSON format, and the prompt
+  # with the three answers needs a bigger context than the default.
+  batch_llm = llm.copy(update={"format": "json", "num_ctx": batch_rewrite_num_ctx(example_tasks, task_description)})
+  answer = LLMChain(prompt=prompt, llm=batch_llm).run({"task_description": task_description})
+  results = parse_batch_rewrite(answer, list(example_tasks))
+  yield from results.items()
+  missing = {role: example for role, example in example_tasks.items() if role not in results}
+  if missing:
+    for role, text in rewrite_tasks(llm, missing, task_description):
+      results[role] = text
+      yield role, text
+  if cache is not None:
+    cache.put("rewrite", key, json.dumps({role: results[role] for role in example_tasks}))